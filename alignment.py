@@ -0,0 +1,272 @@
+"""
+Alignment Module
+Word-level comparison between the passage and a transcript of what the learner
+said. Uses a banded edit-distance alignment, so multi-page passages stay fast:
+only cells near the diagonal are computed (one vectorized row at a time), and
+the band is widened only when the transcript differs from the passage too much
+for it to be sure to hold the best path.
+"""
+
+import re
+
+import numpy as np
+
+# Words are runs of letters/digits, keeping inner apostrophes and hyphens ("don't", "thirty-three")
+WORD_PATTERN = re.compile(r"[^\W_]+(?:['’\-][^\W_]+)*")
+
+# Initial half-width of the band around the diagonal, in words
+INITIAL_BAND = 16
+
+# Edit costs. A substitution costs less than an omission plus an insertion, but
+# more than either alone, so "rain um" against "rhythmic rain" aligns as an
+# omission and an insertion around a match rather than two substitutions.
+SUBSTITUTION_COST = 3
+INDEL_COST = 2
+
+# Backpointers for the alignment traceback
+_DIAGONAL, _UP, _LEFT = 0, 1, 2
+
+_UNREACHABLE = np.iinfo(np.int64).max // 4
+
+
+def tokenize(text):
+    """
+    Split text into words with their character offsets
+
+    Returns:
+        list: (normalized_word, word, start, end) tuples
+    """
+    return [
+        (_normalize(match.group()), match.group(), match.start(), match.end())
+        for match in WORD_PATTERN.finditer(text)
+    ]
+
+
+def _normalize(word):
+    """Compare words case-insensitively and ignoring apostrophe style"""
+    return word.casefold().replace("’", "'")
+
+
+def _banded_alignment(passage, transcript, band):
+    """
+    Align two word ID arrays within a band around the diagonal
+
+    Each row is computed with array operations: diagonal and vertical moves come
+    from the previous row, and horizontal moves within the row are resolved with a
+    running minimum, since cost[j] = min over k <= j of (candidate[k] + INDEL_COST * (j - k)).
+
+    Returns:
+        list: (op, passage_index, transcript_index) tuples, or None if the band was
+            too narrow to prove the result optimal
+    """
+    n, m = len(passage), len(transcript)
+    shift_low, shift_high = min(0, m - n), max(0, m - n)
+
+    rows = []
+    previous = None
+    previous_low = 0
+    for i in range(n + 1):
+        low = max(0, i + shift_low - band)
+        high = min(m, i + shift_high + band)
+        columns = np.arange(low, high + 1)
+        candidates = np.full(high - low + 1, _UNREACHABLE, dtype=np.int64)
+        pointers = np.full(high - low + 1, _DIAGONAL, dtype=np.int8)
+
+        if i == 0:
+            candidates[0] = 0
+        else:
+            previous_high = previous_low + len(previous) - 1
+
+            # Diagonal: match or substitution from (i - 1, j - 1)
+            start = max(low, previous_low + 1, 1)
+            end = min(high, previous_high + 1)
+            if start <= end:
+                substitution = np.where(transcript[start - 1:end] == passage[i - 1], 0, SUBSTITUTION_COST)
+                candidates[start - low:end - low + 1] = (
+                    previous[start - 1 - previous_low:end - previous_low] + substitution
+                )
+
+            # Vertical: passage word omitted, from (i - 1, j)
+            start = max(low, previous_low)
+            end = min(high, previous_high)
+            if start <= end:
+                omission = previous[start - previous_low:end - previous_low + 1] + INDEL_COST
+                segment = candidates[start - low:end - low + 1]
+                better = omission < segment
+                segment[better] = omission[better]
+                pointers[start - low:end - low + 1][better] = _UP
+
+        # Horizontal: extra spoken words, from (i, j - 1)
+        offsets = INDEL_COST * columns
+        costs = np.minimum.accumulate(candidates - offsets) + offsets
+        pointers[costs < candidates] = _LEFT
+
+        rows.append((low, pointers))
+        previous, previous_low = costs, low
+
+    cost = int(previous[m - previous_low])
+
+    # A path leaving the band needs at least |m - n| + 2 * (band + 1) omissions and insertions
+    if cost > INDEL_COST * (abs(m - n) + 2 * (band + 1)) and band < max(n, m):
+        return None
+
+    ops = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        low, pointers = rows[i]
+        pointer = pointers[j - low]
+        if i > 0 and j > 0 and pointer == _DIAGONAL:
+            op = "match" if passage[i - 1] == transcript[j - 1] else "substitution"
+            ops.append((op, i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif i > 0 and (pointer == _UP or j == 0):
+            ops.append(("omission", i - 1, None))
+            i -= 1
+        else:
+            ops.append(("insertion", None, j - 1))
+            j -= 1
+    ops.reverse()
+    return ops
+
+
+def align_words(passage_words, transcript_words):
+    """
+    Find a minimum-edit word alignment between two lists of normalized words
+
+    Returns:
+        list: (op, passage_index, transcript_index) tuples in passage order, where op
+            is "match", "substitution", "omission" or "insertion"
+    """
+    # Words that agree at both ends need no alignment
+    prefix = 0
+    while prefix < min(len(passage_words), len(transcript_words)) and passage_words[prefix] == transcript_words[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < min(len(passage_words), len(transcript_words)) - prefix
+           and passage_words[-1 - suffix] == transcript_words[-1 - suffix]):
+        suffix += 1
+
+    # Map words to integer IDs so rows can be compared as arrays
+    vocabulary = {}
+    passage_ids = np.array([vocabulary.setdefault(word, len(vocabulary))
+                            for word in passage_words[prefix:len(passage_words) - suffix]], dtype=np.int64)
+    transcript_ids = np.array([vocabulary.setdefault(word, len(vocabulary))
+                               for word in transcript_words[prefix:len(transcript_words) - suffix]], dtype=np.int64)
+
+    band = INITIAL_BAND
+    while True:
+        middle = _banded_alignment(passage_ids, transcript_ids, band)
+        if middle is not None:
+            break
+        band *= 2
+
+    ops = [("match", k, k) for k in range(prefix)]
+    ops.extend(
+        (op, None if p is None else p + prefix, None if t is None else t + prefix)
+        for op, p, t in middle
+    )
+    passage_end, transcript_end = len(passage_words) - suffix, len(transcript_words) - suffix
+    ops.extend(("match", passage_end + k, transcript_end + k) for k in range(suffix))
+    return ops
+
+
+def word_timings(words, char_timings):
+    """
+    Map passage words onto character timings from the speech service
+
+    Args:
+        words (list): Output of tokenize() for the passage
+        char_timings (list): {"char_index", "start_time", "end_time"} dicts. These come
+            from the client, so malformed entries (and non-list input) are ignored.
+
+    Returns:
+        list: (start_time, end_time) per word, or (None, None) where timings are missing
+    """
+    starts = {}
+    ends = {}
+    if not isinstance(char_timings, list):
+        char_timings = []
+    for timing in char_timings:
+        if not isinstance(timing, dict):
+            continue
+        index = timing.get("char_index")
+        start_time = timing.get("start_time")
+        end_time = timing.get("end_time")
+        if not isinstance(index, int) or isinstance(index, bool):
+            continue
+        if isinstance(start_time, (int, float)) and not isinstance(start_time, bool):
+            starts[index] = start_time
+        if isinstance(end_time, (int, float)) and not isinstance(end_time, bool):
+            ends[index] = end_time
+    return [(starts.get(start), ends.get(end - 1)) for _, _, start, end in words]
+
+
+def compare_transcript(passage, transcript, char_timings=None):
+    """
+    Compare what the learner said with the passage
+
+    Args:
+        passage (str): The passage that was read
+        transcript (str): What the learner said
+        char_timings (list, optional): Character timings for the passage, used to
+            give each word a start and end time. Defaults to None.
+
+    Returns:
+        dict: {"words": per passage word status, "insertions": extra spoken words,
+            "summary": counts and accuracy}
+    """
+    passage_tokens = tokenize(passage)
+    transcript_tokens = tokenize(transcript)
+    ops = align_words([token[0] for token in passage_tokens], [token[0] for token in transcript_tokens])
+    timings = word_timings(passage_tokens, char_timings)
+
+    words = []
+    for index, (_, word, start, end) in enumerate(passage_tokens):
+        start_time, end_time = timings[index]
+        words.append({
+            "index": index,
+            "word": word,
+            "char_start": start,
+            "char_end": end,
+            "start_time": start_time,
+            "end_time": end_time,
+            "status": "correct",
+            "spoken": word
+        })
+
+    insertions = []
+    counts = {"correct": 0, "substitutions": 0, "omissions": 0, "insertions": 0}
+    next_passage_index = 0
+    for op, passage_index, transcript_index in ops:
+        if op == "match":
+            counts["correct"] += 1
+            next_passage_index = passage_index + 1
+        elif op == "substitution":
+            counts["substitutions"] += 1
+            words[passage_index]["status"] = "substituted"
+            words[passage_index]["spoken"] = transcript_tokens[transcript_index][1]
+            next_passage_index = passage_index + 1
+        elif op == "omission":
+            counts["omissions"] += 1
+            words[passage_index]["status"] = "omitted"
+            words[passage_index]["spoken"] = None
+            next_passage_index = passage_index + 1
+        else:
+            counts["insertions"] += 1
+            # Inserted words sit before the next passage word (or at the end)
+            insertions.append({
+                "spoken": transcript_tokens[transcript_index][1],
+                "position": next_passage_index,
+                "char_index": passage_tokens[next_passage_index][2] if next_passage_index < len(passage_tokens) else len(passage)
+            })
+
+    return {
+        "words": words,
+        "insertions": insertions,
+        "summary": {
+            "passage_words": len(passage_tokens),
+            "transcript_words": len(transcript_tokens),
+            **counts,
+            "accuracy": round(counts["correct"] / len(passage_tokens), 3) if passage_tokens else None
+        }
+    }
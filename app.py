@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, Response, stream_with_context
 import os
 import json
 import base64
@@ -6,11 +6,23 @@ import sounddevice as sd
 import numpy as np
 import wave
 import re
+import time
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
 from dotenv import load_dotenv
 
 # Import service modules
-from elevenlabs_service import elevenlabs_service
+from elevenlabs_service import elevenlabs_service, SHARED_CACHE_NAMESPACE
 from openai_service import openai_service
+from upload_sessions import UploadSessionManager, UploadSessionError, UploadSessionLimitError
+from shared_state import SQLiteStateStore
+from metrics import metrics
+from history_store import LearnerHistoryStore
+from deadline import Deadline, DeadlineExceeded
+from warmup import Warmup
 
 # Load environment variables
 load_dotenv()
@@ -23,16 +35,247 @@ if not api_key:
 else:
     print("OpenAI API key found. Length:", len(api_key))
 
-app = Flask(__name__)
+# Routes are registered on the app by create_app()
+bp = Blueprint('main', __name__)
 
 # Sample passage (hardcoded)
 SAMPLE_PASSAGE = "The rhythmic rain thundered through the rural area yesterday, creating murals of puddles on the asphalt. Thirty-three thirsty children gathered around the water fountain, their voices carrying through the corridor. The authorities particularly wanted to measure whether accurate pronunciation remained consistent..."
 
-@app.route('/')
+# Maximum number of voices a single batch request may render
+MAX_BATCH_VOICES = 8
+
+AUDIO_DIR = os.path.join(os.path.dirname(__file__), 'static', 'audio')
+
+# Generated audio files are deleted after 5 minutes
+AUDIO_TTL_SECONDS = 300
+
+# How often each worker sweeps expired audio, upload sessions and cache entries
+MAINTENANCE_INTERVAL_SECONDS = 60
+
+# How often each worker adds its buffered metric increments to the shared totals
+METRICS_FLUSH_INTERVAL_SECONDS = 5
+
+def purge_expired_audio(state_store):
+    """Delete published audio files whose time in static/audio has run out"""
+    for static_filename, value in state_store.pop_expired("audio_files"):
+        file_path = json.loads(value)["path"]
+        try:
+            if os.path.exists(file_path):
+                os.unlink(file_path)
+                print(f"Deleted temporary audio file: {file_path}")
+        except Exception as e:
+            print(f"Error deleting file {file_path}: {e}")
+
+def run_maintenance(app):
+    """Remove expired audio files, upload sessions and shared cache entries"""
+    state_store = app.extensions["state_store"]
+    purge_expired_audio(state_store)
+    app.extensions["upload_sessions"].purge_expired()
+    removed = state_store.delete_expired(SHARED_CACHE_NAMESPACE)
+    if removed:
+        print(f"Removed {removed} expired speech cache entries")
+
+def start_maintenance(app):
+    """
+    Run maintenance and flush metrics on a background thread bound to this app
+    
+    The thread stops when app.extensions["maintenance_stop"] is set or the app is
+    garbage-collected, so apps created and dropped (tests, the debug reloader)
+    don't leave threads working on their state store.
+    """
+    stop = threading.Event()
+    app.extensions["maintenance_stop"] = stop
+    app_ref = weakref.ref(app)
+    flush_interval = app.config["METRICS_FLUSH_INTERVAL_SECONDS"]
+    maintenance_interval = app.config["MAINTENANCE_INTERVAL_SECONDS"]
+    
+    def loop():
+        last_maintenance = time.monotonic()
+        while not stop.wait(flush_interval):
+            current = app_ref()
+            if current is None:
+                return
+            metrics.flush(current.extensions["state_store"])
+            if time.monotonic() - last_maintenance >= maintenance_interval:
+                last_maintenance = time.monotonic()
+                try:
+                    run_maintenance(current)
+                except Exception as e:
+                    print(f"Error during maintenance: {e}")
+            del current
+    
+    thread = threading.Thread(target=loop, name="maintenance", daemon=True)
+    thread.start()
+    return thread
+
+def publish_audio_file(temp_path, prefix="speech"):
+    """
+    Move a generated audio file into static/audio and schedule it for deletion
+    
+    Returns:
+        str: Cache-busted URL the browser can fetch the audio from
+    """
+    # Create a static folder if it doesn't exist
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    
+    # Move the temporary file to the static folder with a unique name
+    timestamp = int(time.time())
+    static_filename = f"{prefix}_{timestamp}_{uuid.uuid4().hex[:8]}.mp3"
+    static_path = os.path.join(AUDIO_DIR, static_filename)
+    shutil.copy(temp_path, static_path)
+    
+    # Remove the temporary file immediately
+    try:
+        os.unlink(temp_path)
+        print(f"Temporary file {temp_path} deleted")
+    except Exception as e:
+        print(f"Error deleting temporary file: {e}")
+    
+    # Record the file so whichever worker runs the next purge deletes it once it expires
+    state_store = current_app.extensions["state_store"]
+    state_store.set_json("audio_files", static_filename, {"path": static_path},
+                         ttl=current_app.config["AUDIO_TTL_SECONDS"])
+    print(f"Audio file {static_path} scheduled for deletion after playback")
+    purge_expired_audio(state_store)
+    
+    # Add a cache-busting parameter to the audio URL
+    return f"/static/audio/{static_filename}?t={timestamp}"
+
+# Mock feedback returned when no OpenAI API key is configured
+MOCK_FEEDBACK = {
+    "pronunciation": {
+        "score": 8,
+        "details": "Your pronunciation is generally good. Pay attention to the 'th' sound in 'thirty-three' and 'rhythmic'."
+    },
+    "rhythm": {
+        "score": 7,
+        "details": "Good rhythm overall, but try to maintain a more consistent pace throughout."
+    },
+    "clarity": {
+        "score": 9,
+        "details": "Your speech was very clear. Great job enunciating difficult words."
+    }
+}
+
+def use_mock_data():
+    """Check if we're using mock data (for testing without API keys)"""
+    return os.getenv("USE_MOCK_DATA") == "true" or not os.getenv("OPENAI_API_KEY")
+
+def request_deadline():
+    """
+    Build the deadline for the current request.
+    
+    Clients may send their time budget in seconds as an X-Request-Timeout header
+    or a "timeout" body field. Requests without one get no deadline (None) and
+    run until done or until the client disconnects.
+    """
+    body = request.get_json(silent=True) or {}
+    return Deadline.from_request(request.headers.get('X-Request-Timeout'), body.get('timeout'))
+
+def deadline_exceeded_response(e):
+    """Response for a request whose deadline ran out before it could be answered"""
+    print(f"Deadline exceeded: {e}")
+    return jsonify({
+        "success": False,
+        "error": str(e),
+        "deadline_exceeded": True
+    }), 504
+
+def save_uploaded_audio(audio_data, deadline=None):
+    """
+    Decode a base64 data URI recording and save it for analysis
+    
+    Returns:
+        str: Path of the saved recording; the caller is responsible for deleting it
+    """
+    if deadline is not None:
+        deadline.check("decoding")
+    
+    # Decode base64 audio
+    audio_binary = base64.b64decode(audio_data.split(',')[1])
+    
+    # Save audio file temporarily, under a unique name so concurrent requests don't collide
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+        f.write(audio_binary)
+        temp_audio_path = f.name
+    
+    print(f"Saved user recording to {temp_audio_path}")
+    return temp_audio_path
+
+def record_history(learner_id, passage, feedback):
+    """Add parsed feedback to a learner's history; failures are logged, not raised"""
+    if not learner_id or "error" in feedback:
+        return
+    try:
+        current_app.extensions["history_store"].record(learner_id, passage, feedback)
+    except Exception as e:
+        print(f"Error recording history for learner {learner_id}: {e}")
+
+def sse_event(event, data):
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_analysis_response(passage, native_language, target_language, accent_goal, audio_file_path=None, mp3_data=None, learner_id=None, deadline=None, char_timings=None):
+    """
+    Build a server-sent event response that streams analysis feedback sections.
+    
+    Emits a "section" event for each completed feedback section, then a
+    "complete" event with the full feedback, or an "error" event on failure.
+    audio_file_path, if given, is deleted once the stream ends. If learner_id is
+    given, the completed feedback is added to the learner's history. char_timings
+    (the passage audio's character timings) timestamp words in the reading accuracy
+    report. A deadline only bounds the work before and between provider calls; once
+    feedback is streaming it runs until done or until the client disconnects.
+    """
+    def stream_feedback():
+        try:
+            yield from stream_events()
+        finally:
+            if audio_file_path and os.path.exists(audio_file_path):
+                os.unlink(audio_file_path)
+    
+    def stream_events():
+        if use_mock_data():
+            print("Using mock data for streamed speech analysis")
+            for key, section in MOCK_FEEDBACK.items():
+                yield sse_event("section", {"section": key, "data": section})
+            yield sse_event("complete", {"success": True, "feedback": MOCK_FEEDBACK})
+            return
+        
+        try:
+            for event in openai_service.analyze_speech_stream(
+                audio_file_path=audio_file_path,
+                text_passage=passage,
+                native_language=native_language,
+                target_language=target_language,
+                accent_goal=accent_goal,
+                mp3_data=mp3_data,
+                deadline=deadline,
+                char_timings=char_timings
+            ):
+                if event["event"] == "complete":
+                    record_history(learner_id, passage, event["feedback"])
+                    yield sse_event("complete", {"success": True, "feedback": event["feedback"], "usage": event.get("usage", {})})
+                else:
+                    yield sse_event(event["event"], {k: v for k, v in event.items() if k != "event"})
+        except DeadlineExceeded as e:
+            print(f"Deadline exceeded in analysis stream: {e}")
+            yield sse_event("error", {"success": False, "error": str(e), "deadline_exceeded": True})
+        except Exception as e:
+            print(f"Exception in analysis stream: {e}")
+            yield sse_event("error", {"success": False, "error": f"Error analyzing speech: {str(e)}"})
+    
+    response = Response(stream_with_context(stream_feedback()), mimetype='text/event-stream')
+    # Stop proxies from buffering the stream
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/')
 def index():
     return render_template('index.html', passage=SAMPLE_PASSAGE)
 
-@app.route('/generate-speech', methods=['POST'])
+@bp.route('/generate-speech', methods=['POST'])
 def generate_speech():
     try:
         # Get user-provided passage from the request
@@ -45,62 +288,22 @@ def generate_speech():
         print(f"Generating speech for text: {passage[:50]}...")
         
         # Create a temporary file path (will only be used temporarily)
-        import tempfile
         with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
             temp_path = temp_file.name
         
         # Use the ElevenLabs service to generate speech with timestamps
         result = elevenlabs_service.generate_speech_with_timestamps(
             text=passage,
-            output_path=temp_path
+            output_path=temp_path,
+            shared_cache=current_app.extensions["state_store"]
         )
         
         if result["success"]:
             # Process character timings
             char_timings = result.get("char_timings", [])
             
-            # Create a static folder if it doesn't exist
-            audio_dir = os.path.join(os.path.dirname(__file__), 'static', 'audio')
-            os.makedirs(audio_dir, exist_ok=True)
-            
-            # Move the temporary file to the static folder with a unique name
-            import time
-            import shutil
-            timestamp = int(time.time())
-            static_filename = f"speech_{timestamp}.mp3"
-            static_path = os.path.join(audio_dir, static_filename)
-            
-            # Copy the file to the static folder
-            shutil.copy(temp_path, static_path)
-            
-            # Remove the temporary file immediately
-            try:
-                os.unlink(temp_path)
-                print(f"Temporary file {temp_path} deleted")
-            except Exception as e:
-                print(f"Error deleting temporary file: {e}")
-            
-            # Add a cache-busting parameter to the audio URL
-            audio_url = f"/static/audio/{static_filename}?t={timestamp}"
-            
-            # Set up a timer to delete the static file after 5 minutes
-            def delete_file_later(file_path, delay=300):
-                import threading
-                def delete_file():
-                    try:
-                        if os.path.exists(file_path):
-                            os.unlink(file_path)
-                            print(f"Deleted temporary audio file: {file_path}")
-                    except Exception as e:
-                        print(f"Error deleting file {file_path}: {e}")
-                
-                timer = threading.Timer(delay, delete_file)
-                timer.daemon = True
-                timer.start()
-            
-            # Schedule the file for deletion
-            delete_file_later(static_path)
-            print(f"Audio file {static_path} scheduled for deletion after playback")
+            # Move the audio into the static folder and schedule its deletion
+            audio_url = publish_audio_file(temp_path)
             
             return jsonify({
                 "success": True,
@@ -122,7 +325,90 @@ def generate_speech():
             "error": str(e)
         })
 
-@app.route('/analyze-speech', methods=['POST'])
+@bp.route('/generate-speech-batch', methods=['POST'])
+def generate_speech_batch():
+    """
+    Render one passage with several voices concurrently.
+    
+    Streams newline-delimited JSON, one object per voice, in completion order.
+    """
+    try:
+        passage = request.json.get('passage', '')
+        voice_ids = request.json.get('voice_ids') or []
+        max_concurrency = request.json.get('max_concurrency')
+        
+        if not passage.strip():
+            passage = SAMPLE_PASSAGE
+        
+        if not isinstance(voice_ids, list) or not voice_ids:
+            return jsonify({
+                "success": False,
+                "error": "voice_ids must be a non-empty list"
+            })
+        
+        # Reject bad IDs now; errors inside the stream would truncate a 200 response
+        if not all(isinstance(voice_id, str) and voice_id.strip() for voice_id in voice_ids):
+            return jsonify({
+                "success": False,
+                "error": "voice_ids must be non-empty strings"
+            })
+        
+        if max_concurrency is not None:
+            max_concurrency = int(max_concurrency)
+        
+        if len(voice_ids) > MAX_BATCH_VOICES:
+            return jsonify({
+                "success": False,
+                "error": f"At most {MAX_BATCH_VOICES} voices can be rendered per batch"
+            })
+        
+        print(f"Generating speech for {len(voice_ids)} voices, text: {passage[:50]}...")
+        
+        temp_dir = tempfile.mkdtemp(prefix="speech_batch_")
+        state_store = current_app.extensions["state_store"]
+        
+        def output_path_for(voice_id):
+            return os.path.join(temp_dir, f"{uuid.uuid4().hex}.mp3")
+        
+        def stream_results():
+            try:
+                for result in elevenlabs_service.generate_speech_batch(
+                    text=passage,
+                    voice_ids=voice_ids,
+                    output_path_for=output_path_for,
+                    max_concurrency=max_concurrency,
+                    shared_cache=state_store
+                ):
+                    if result["success"]:
+                        item = {
+                            "success": True,
+                            "voice_id": result["voice_id"],
+                            "audio_url": publish_audio_file(result["audio_path"]),
+                            "char_timings": result.get("char_timings", []),
+                            "cached": result.get("cached", False)
+                        }
+                    else:
+                        item = {
+                            "success": False,
+                            "voice_id": result.get("voice_id"),
+                            "error": result.get("error", "Unknown error generating speech")
+                        }
+                    yield json.dumps(item) + "\n"
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        
+        return Response(stream_with_context(stream_results()), mimetype='application/x-ndjson')
+    
+    except Exception as e:
+        print(f"Exception in generate_speech_batch: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        })
+
+@bp.route('/analyze-speech', methods=['POST'])
 def analyze_speech():
     try:
         # Get the audio data and user-provided passage
@@ -131,6 +417,9 @@ def analyze_speech():
         native_language = request.json.get('native_language')
         target_language = request.json.get('target_language')
         accent_goal = request.json.get('accent_goal')
+        learner_id = request.json.get('learner_id')
+        char_timings = request.json.get('char_timings')
+        deadline = request_deadline()
         
         if not audio_data:
             return jsonify({
@@ -146,15 +435,9 @@ def analyze_speech():
         print(f"Language preferences - Native: {native_language}, Target: {target_language}, Accent Goal: {accent_goal}")
         
         try:
-            # Decode base64 audio
-            audio_binary = base64.b64decode(audio_data.split(',')[1])
-            
-            # Save audio file temporarily
-            temp_audio_path = os.path.join(os.path.dirname(__file__), 'static', 'audio', 'user_recording.wav')
-            with open(temp_audio_path, "wb") as f:
-                f.write(audio_binary)
-                
-            print(f"Saved user recording to {temp_audio_path}")
+            temp_audio_path = save_uploaded_audio(audio_data, deadline)
+        except DeadlineExceeded as e:
+            return deadline_exceeded_response(e)
         except Exception as e:
             print(f"Error processing audio data: {e}")
             return jsonify({
@@ -162,45 +445,38 @@ def analyze_speech():
                 "error": f"Error processing audio data: {str(e)}"
             })
         
-        # Check if we're using mock data (for testing without API keys)
-        use_mock = os.getenv("USE_MOCK_DATA") == "true" or not os.getenv("OPENAI_API_KEY")
-        if use_mock:
-            print("Using mock data for speech analysis")
+        try:
+            # Check if we're using mock data (for testing without API keys)
+            if use_mock_data():
+                print("Using mock data for speech analysis")
+                
+                # Return mock feedback data
+                return jsonify({
+                    "success": True,
+                    "feedback": MOCK_FEEDBACK
+                })
             
-            # Return mock feedback data
-            return jsonify({
-                "success": True,
-                "feedback": {
-                    "pronunciation": {
-                        "score": 8,
-                        "details": "Your pronunciation is generally good. Pay attention to the 'th' sound in 'thirty-three' and 'rhythmic'."
-                    },
-                    "rhythm": {
-                        "score": 7,
-                        "details": "Good rhythm overall, but try to maintain a more consistent pace throughout."
-                    },
-                    "clarity": {
-                        "score": 9,
-                        "details": "Your speech was very clear. Great job enunciating difficult words."
-                    }
-                }
-            })
-        
-        # Use the OpenAI service to analyze the speech
-        print("Calling OpenAI service for speech analysis")
-        result = openai_service.analyze_speech(
-            audio_file_path=temp_audio_path,
-            text_passage=passage,
-            native_language=native_language,
-            target_language=target_language,
-            accent_goal=accent_goal
-        )
+            # Use the OpenAI service to analyze the speech
+            print("Calling OpenAI service for speech analysis")
+            result = openai_service.analyze_speech(
+                audio_file_path=temp_audio_path,
+                text_passage=passage,
+                native_language=native_language,
+                target_language=target_language,
+                accent_goal=accent_goal,
+                deadline=deadline,
+                char_timings=char_timings
+            )
+        finally:
+            os.unlink(temp_audio_path)
         
         if result["success"]:
             print("Successfully analyzed speech")
+            record_history(learner_id, passage, result["feedback"])
             return jsonify({
                 "success": True,
-                "feedback": result["feedback"]
+                "feedback": result["feedback"],
+                "usage": result.get("usage", {})
             })
         else:
             print(f"Error from OpenAI service: {result.get('error')}")
@@ -209,6 +485,8 @@ def analyze_speech():
                 "error": result.get("error", "Unknown error analyzing speech")
             })
     
+    except DeadlineExceeded as e:
+        return deadline_exceeded_response(e)
     except Exception as e:
         print(f"Exception in analyze_speech: {e}")
         import traceback
@@ -218,7 +496,224 @@ def analyze_speech():
             "error": f"Error analyzing speech: {str(e)}"
         })
 
-@app.route('/check-api-keys', methods=['GET'])
+@bp.route('/analyze-speech-stream', methods=['POST'])
+def analyze_speech_stream():
+    """
+    Analyze speech and stream feedback sections as server-sent events.
+    
+    Accepts the same body as /analyze-speech.
+    """
+    try:
+        audio_data = request.json.get('audio')
+        passage = request.json.get('passage', '')
+        native_language = request.json.get('native_language')
+        target_language = request.json.get('target_language')
+        accent_goal = request.json.get('accent_goal')
+        learner_id = request.json.get('learner_id')
+        char_timings = request.json.get('char_timings')
+        deadline = request_deadline()
+        
+        if not audio_data:
+            return jsonify({
+                "success": False,
+                "error": "No audio data provided"
+            })
+        
+        # Use sample passage as fallback if empty
+        if not passage.strip():
+            passage = SAMPLE_PASSAGE
+        
+        print(f"Streaming analysis for text: {passage[:50]}...")
+        
+        try:
+            temp_audio_path = save_uploaded_audio(audio_data, deadline)
+        except DeadlineExceeded as e:
+            return deadline_exceeded_response(e)
+        except Exception as e:
+            print(f"Error processing audio data: {e}")
+            return jsonify({
+                "success": False,
+                "error": f"Error processing audio data: {str(e)}"
+            })
+        
+        return stream_analysis_response(
+            passage=passage,
+            native_language=native_language,
+            target_language=target_language,
+            accent_goal=accent_goal,
+            audio_file_path=temp_audio_path,
+            learner_id=learner_id,
+            deadline=deadline,
+            char_timings=char_timings
+        )
+    
+    except Exception as e:
+        print(f"Exception in analyze_speech_stream: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "success": False,
+            "error": f"Error analyzing speech: {str(e)}"
+        })
+
+@bp.route('/upload-sessions', methods=['POST'])
+def create_upload_session():
+    """Start an upload session that receives recording chunks while the user speaks"""
+    try:
+        session_id = current_app.extensions["upload_sessions"].create()
+        return jsonify({
+            "success": True,
+            "session_id": session_id
+        })
+    except UploadSessionLimitError as e:
+        # The browser falls back to posting the full recording
+        print(f"Rejected upload session: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 503
+    except Exception as e:
+        print(f"Exception in create_upload_session: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        })
+
+@bp.route('/upload-sessions/<session_id>/chunks', methods=['POST'])
+def upload_session_chunk(session_id):
+    """Append a raw MediaRecorder chunk; the sequence number is passed as ?seq=N"""
+    try:
+        seq = int(request.args.get('seq', '-1'))
+        received_bytes = current_app.extensions["upload_sessions"].append(session_id, seq, request.get_data())
+        return jsonify({
+            "success": True,
+            "received_bytes": received_bytes
+        })
+    except (UploadSessionError, ValueError) as e:
+        print(f"Error appending chunk to upload session {session_id}: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        })
+
+@bp.route('/upload-sessions/<session_id>', methods=['DELETE'])
+def discard_upload_session(session_id):
+    """Abandon an upload session"""
+    current_app.extensions["upload_sessions"].discard(session_id)
+    return jsonify({"success": True})
+
+@bp.route('/upload-sessions/<session_id>/analyze', methods=['POST'])
+def analyze_upload_session(session_id):
+    """
+    Finish an upload session and stream its analysis as server-sent events.
+    
+    Accepts the same body as /analyze-speech-stream without the audio field.
+    """
+    try:
+        passage = request.json.get('passage', '')
+        native_language = request.json.get('native_language')
+        target_language = request.json.get('target_language')
+        accent_goal = request.json.get('accent_goal')
+        learner_id = request.json.get('learner_id')
+        char_timings = request.json.get('char_timings')
+        deadline = request_deadline()
+        
+        # Use sample passage as fallback if empty
+        if not passage.strip():
+            passage = SAMPLE_PASSAGE
+        
+        try:
+            mp3_data = current_app.extensions["upload_sessions"].finish(session_id, deadline)
+            print(f"Upload session {session_id} finished with {len(mp3_data)} bytes of MP3")
+        except DeadlineExceeded as e:
+            return deadline_exceeded_response(e)
+        except Exception as e:
+            print(f"Error finishing upload session {session_id}: {e}")
+            return jsonify({
+                "success": False,
+                "error": f"Error processing audio data: {str(e)}"
+            })
+        
+        return stream_analysis_response(
+            passage=passage,
+            native_language=native_language,
+            target_language=target_language,
+            accent_goal=accent_goal,
+            mp3_data=mp3_data,
+            learner_id=learner_id,
+            deadline=deadline,
+            char_timings=char_timings
+        )
+    
+    except Exception as e:
+        print(f"Exception in analyze_upload_session: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "success": False,
+            "error": f"Error analyzing speech: {str(e)}"
+        })
+
+@bp.route('/history/<learner_id>', methods=['GET'])
+def learner_history(learner_id):
+    """Endpoint to list a learner's recent sessions, optionally for one passage"""
+    try:
+        passage = request.args.get('passage')
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+        return jsonify({
+            "success": True,
+            "sessions": current_app.extensions["history_store"].history(learner_id, passage=passage, limit=limit)
+        })
+    except Exception as e:
+        print(f"Error reading history for learner {learner_id}: {e}")
+        return jsonify({"success": False, "error": str(e)})
+
+@bp.route('/history/<learner_id>/trend', methods=['GET'])
+def learner_trend(learner_id):
+    """Endpoint to report a learner's average scores per day"""
+    try:
+        passage = request.args.get('passage')
+        days = request.args.get('days', type=int)
+        return jsonify({
+            "success": True,
+            "trend": current_app.extensions["history_store"].trend(learner_id, passage=passage, days=days)
+        })
+    except Exception as e:
+        print(f"Error reading trend for learner {learner_id}: {e}")
+        return jsonify({"success": False, "error": str(e)})
+
+@bp.route('/history/<learner_id>/percentile', methods=['GET'])
+def learner_percentile(learner_id):
+    """Endpoint to rank a learner's latest score against all sessions"""
+    try:
+        passage = request.args.get('passage')
+        category = request.args.get('category', 'overall')
+        history_store = current_app.extensions["history_store"]
+        return jsonify({
+            "success": True,
+            "category": category,
+            "rank": history_store.percentile(learner_id, passage=passage, category=category),
+            "distribution": history_store.distribution(passage=passage, category=category)
+        })
+    except Exception as e:
+        print(f"Error reading percentile for learner {learner_id}: {e}")
+        return jsonify({"success": False, "error": str(e)})
+
+@bp.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness endpoint: the worker process is up"""
+    return jsonify({"alive": True})
+
+@bp.route('/ready', methods=['GET'])
+def ready():
+    """Readiness endpoint: 200 once warm-up has finished, 503 before"""
+    warmup = current_app.extensions["warmup"]
+    return jsonify({
+        "ready": warmup.is_ready(),
+        **warmup.state()
+    }), 200 if warmup.is_ready() else 503
+
+@bp.route('/check-api-keys', methods=['GET'])
 def check_api_keys():
     """Endpoint to check if API keys are properly configured"""
     openai_key = os.getenv("OPENAI_API_KEY")
@@ -229,7 +724,29 @@ def check_api_keys():
         "elevenlabs_key_present": bool(elevenlabs_key)
     })
 
-@app.route('/browser-info', methods=['POST'])
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Endpoint to report provider usage and request coalescing counters"""
+    counters = metrics.snapshot(current_app.extensions["state_store"])
+    
+    # Share of provider requests answered by an identical in-flight call
+    coalescing = {}
+    for service in ("elevenlabs", "openai"):
+        leaders = counters.get(f"singleflight.{service}.leaders", 0)
+        followers = counters.get(f"singleflight.{service}.followers", 0)
+        total = leaders + followers
+        coalescing[service] = {
+            "requests": total,
+            "coalesced": followers,
+            "coalesced_rate": round(followers / total, 3) if total else 0.0
+        }
+    
+    return jsonify({
+        "counters": counters,
+        "coalescing": coalescing
+    })
+
+@bp.route('/browser-info', methods=['POST'])
 def browser_info():
     """Endpoint to log browser information for debugging"""
     try:
@@ -248,7 +765,60 @@ def browser_info():
         print(f"Error logging browser info: {e}")
         return jsonify({"success": False, "error": str(e)})
 
-if __name__ == '__main__':
+def create_app(config=None):
+    """
+    Application factory.
+    
+    Each worker process builds its own app; workers on the same node share caches,
+    upload sessions and audio file metadata through the SQLite state store, e.g.
+    
+        gunicorn -w 4 'app:create_app()'
+    
+    Set WARMUP_ON_START=true to warm each worker in the background; /ready
+    answers 503 until that worker is warm.
+    
+    The state store and everything bound to it live on the app, and are passed
+    to the module-level services per call, so creating another app doesn't
+    rewire the services under an existing one.
+    
+    Args:
+        config (dict, optional): Overrides for the default configuration. Defaults to None.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        STATE_DB_PATH=os.getenv("STATE_DB_PATH"),
+        HISTORY_DB_PATH=os.getenv("HISTORY_DB_PATH"),
+        WARMUP_ON_START=os.getenv("WARMUP_ON_START") == "true",
+        AUDIO_TTL_SECONDS=AUDIO_TTL_SECONDS,
+        MAINTENANCE_INTERVAL_SECONDS=MAINTENANCE_INTERVAL_SECONDS,
+        METRICS_FLUSH_INTERVAL_SECONDS=METRICS_FLUSH_INTERVAL_SECONDS
+    )
+    if config:
+        app.config.update(config)
+    
     # Ensure the audio directory exists
-    os.makedirs(os.path.join(os.path.dirname(__file__), 'static', 'audio'), exist_ok=True)
-    app.run(debug=True) 
\ No newline at end of file
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    
+    state_store = SQLiteStateStore(app.config["STATE_DB_PATH"])
+    app.extensions["state_store"] = state_store
+    app.extensions["upload_sessions"] = UploadSessionManager(state_store)
+    app.extensions["history_store"] = LearnerHistoryStore(app.config["HISTORY_DB_PATH"])
+    
+    # Clean up audio left behind by workers that have since exited, then keep
+    # sweeping so files don't outlive their TTL during quiet periods
+    run_maintenance(app)
+    start_maintenance(app)
+    
+    # Optionally warm provider connections, ffmpeg and the parser before reporting ready
+    warmup = Warmup(openai_service, elevenlabs_service)
+    app.extensions["warmup"] = warmup
+    if app.config["WARMUP_ON_START"]:
+        warmup.start()
+    else:
+        warmup.mark_ready()
+    
+    app.register_blueprint(bp)
+    return app
+
+if __name__ == '__main__':
+    create_app().run(debug=True)
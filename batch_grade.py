@@ -0,0 +1,358 @@
+"""
+Batch Grading Module
+Grades a directory of recordings against one passage from the command line, for
+teachers uploading a whole class at once.
+
+Recordings are transcoded in a process pool, running ahead of analysis up to a
+bounded buffer, and analyzed in a thread pool. Every provider request (including
+the detailed-prompt retry) is paced by a shared rate limiter and retried with
+backoff when the provider rate-limits us. Each result is appended to a JSON Lines file as soon as
+it is ready, and recordings already graded in that file are skipped, so an
+interrupted run picks up where it stopped.
+
+Usage:
+    python batch_grade.py recordings/ --passage-file passage.txt --output results.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from openai import RateLimitError
+
+from deadline import Deadline
+from transcoding import convert_to_mp3
+
+# Recording formats ffmpeg is asked to transcode
+RECORDING_EXTENSIONS = {'.wav', '.webm', '.ogg', '.mp3', '.m4a', '.flac'}
+
+# Default pool sizes and provider pacing
+DEFAULT_WORKERS = os.cpu_count() or 2
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_MINUTE = 30
+
+# Retries for a rate-limited provider call, with exponential backoff between them
+MAX_RATE_LIMIT_RETRIES = 5
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60
+
+# Time budget for one provider request, in seconds, started once the rate limiter
+# lets it through so time spent waiting or backing off doesn't count against it
+PROVIDER_CALL_TIMEOUT_SECONDS = 120
+
+# Transcoded recordings that may wait for analysis, per analysis thread
+BUFFERED_PER_THREAD = 2
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all analysis threads.
+
+    Allows short bursts up to `burst` calls, then paces calls at `rate_per_minute`.
+    pause() empties the bucket for a while after the provider reports a rate limit,
+    so every thread backs off, not just the one that was rejected.
+    """
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.pauses = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call may be made"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out calls for `seconds`"""
+        with self._lock:
+            self.pauses += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+
+def find_recordings(directory):
+    """Return the recording files in a directory, sorted by name"""
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if os.path.splitext(name)[1].lower() in RECORDING_EXTENSIONS
+        and os.path.isfile(os.path.join(directory, name))
+    )
+
+
+def load_checkpoint(output_path):
+    """
+    Read the names of recordings already graded successfully in a results file
+
+    Failed results are not counted, so those recordings are retried.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            if result.get("success"):
+                completed.add(result["file"])
+    return completed
+
+
+def transcode_recording(path):
+    """
+    Convert a recording to MP3 (runs in a worker process)
+
+    Returns:
+        tuple: (mp3_data, seconds taken)
+    """
+    started = time.time()
+    mp3_data = convert_to_mp3(path)
+    return mp3_data, time.time() - started
+
+
+def create_rate_limited_service(rate_limiter):
+    """
+    Build an OpenAIService whose every provider request waits for the shared rate limiter
+
+    Rate-limited requests are retried individually with exponential backoff, so a
+    rejected detailed-prompt retry doesn't repeat the first analysis request. Each
+    request gets its own PROVIDER_CALL_TIMEOUT_SECONDS deadline once it is let through.
+
+    openai_service is imported here rather than at module level because importing it
+    creates its client, which needs OPENAI_API_KEY; main() checks for the key first,
+    and transcoding workers never need the service at all.
+    """
+    from openai_service import OpenAIService
+
+    class RateLimitedOpenAIService(OpenAIService):
+        def _create_completion(self, deadline, stage, **kwargs):
+            for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+                rate_limiter.acquire()
+                try:
+                    return super()._create_completion(Deadline(PROVIDER_CALL_TIMEOUT_SECONDS), stage, **kwargs)
+                except RateLimitError as e:
+                    if attempt == MAX_RATE_LIMIT_RETRIES:
+                        raise
+                    backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+                    print(f"Rate limited during {stage} ({e}); backing off for {backoff:.1f}s")
+                    rate_limiter.pause(backoff)
+
+    return RateLimitedOpenAIService()
+
+
+def analyze_recording(service, mp3_data, passage, options):
+    """
+    Analyze one transcoded recording (runs in an analysis thread)
+
+    Returns:
+        dict: Result fields for the results file
+    """
+    analysis = service.analyze_speech(
+        audio_file_path=None,
+        text_passage=passage,
+        mp3_data=mp3_data,
+        **options
+    )
+    return {
+        "success": analysis["success"],
+        "feedback": analysis.get("feedback"),
+        "usage": analysis.get("usage", {})
+    }
+
+
+def run_batch(recordings, passage, output_path, options=None, workers=DEFAULT_WORKERS,
+              concurrency=DEFAULT_CONCURRENCY, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE):
+    """
+    Grade recordings and append the results to output_path
+
+    Args:
+        recordings (list): Paths of the recordings to grade
+        passage (str): The passage that was read
+        output_path (str): JSON Lines results file; recordings already graded in it are skipped
+        options (dict, optional): Extra analyze_speech arguments (native_language,
+            target_language, accent_goal). Defaults to None.
+        workers (int, optional): Transcoding processes. Defaults to DEFAULT_WORKERS.
+        concurrency (int, optional): Analysis threads. Defaults to DEFAULT_CONCURRENCY.
+        requests_per_minute (float, optional): Provider request rate limit, counting each
+            request an analysis makes. Defaults to DEFAULT_REQUESTS_PER_MINUTE.
+
+    Returns:
+        dict: Throughput summary
+    """
+    completed = load_checkpoint(output_path)
+    pending = [path for path in recordings if os.path.basename(path) not in completed]
+    print(f"Grading {len(pending)} recordings ({len(recordings) - len(pending)} already graded in {output_path})")
+
+    rate_limiter = RateLimiter(requests_per_minute, burst=concurrency)
+    service = create_rate_limited_service(rate_limiter)
+    graded = failed = 0
+    tokens = {}
+    transcode_seconds = 0.0
+    started = time.time()
+
+    # Recordings transcoding or transcoded but not yet analyzed. Bounding this keeps
+    # MP3s from piling up in memory when analysis is the bottleneck.
+    max_buffered = workers + BUFFERED_PER_THREAD * concurrency
+    queue = list(reversed(pending))
+    transcodes = {}
+    analyses = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as process_pool, \
+            ThreadPoolExecutor(max_workers=concurrency) as thread_pool, \
+            open(output_path, 'a', encoding='utf-8') as output:
+        while queue or transcodes or analyses:
+            while queue and len(transcodes) + len(analyses) < max_buffered:
+                path = queue.pop()
+                transcodes[process_pool.submit(transcode_recording, path)] = (path, time.time())
+
+            done, _ = wait(list(transcodes) + list(analyses), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in transcodes:
+                    path, submitted = transcodes.pop(future)
+                    try:
+                        mp3_data, seconds = future.result()
+                    except Exception as e:
+                        result = {"success": False, "error": str(e)}
+                    else:
+                        analysis = thread_pool.submit(analyze_recording, service, mp3_data, passage, options or {})
+                        analyses[analysis] = (path, submitted, seconds)
+                        continue
+                else:
+                    path, submitted, seconds = analyses.pop(future)
+                    try:
+                        result = future.result()
+                        result["transcode_seconds"] = round(seconds, 3)
+                    except Exception as e:
+                        result = {"success": False, "error": str(e)}
+
+                if not result["success"]:
+                    print(f"Error grading {path}: {result.get('error')}")
+                result = {"file": os.path.basename(path), **result,
+                          "seconds": round(time.time() - submitted, 3)}
+
+                # Results are written from this thread only, in completion order
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+
+                if result["success"]:
+                    graded += 1
+                    transcode_seconds += result.get("transcode_seconds", 0)
+                    for key, value in result.get("usage", {}).items():
+                        tokens[key] = tokens.get(key, 0) + value
+                else:
+                    failed += 1
+                print(f"[{graded + failed}/{len(pending)}] {result['file']}: "
+                      f"{'graded' if result['success'] else 'failed'} in {result['seconds']:.1f}s")
+
+    elapsed = time.time() - started
+    return {
+        "recordings": len(recordings),
+        "skipped": len(recordings) - len(pending),
+        "graded": graded,
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 1),
+        "recordings_per_minute": round(60 * (graded + failed) / elapsed, 1) if elapsed > 0 else None,
+        "average_transcode_seconds": round(transcode_seconds / graded, 2) if graded else None,
+        "rate_limit_retries": rate_limiter.pauses,
+        "tokens": tokens
+    }
+
+
+def print_summary(summary):
+    """Print the throughput summary at the end of a run"""
+    print("\nBatch grading summary")
+    print(f"  Recordings:          {summary['recordings']} ({summary['skipped']} skipped from checkpoint)")
+    print(f"  Graded:              {summary['graded']}")
+    print(f"  Failed:              {summary['failed']}")
+    print(f"  Elapsed:             {summary['elapsed_seconds']}s")
+    print(f"  Throughput:          {summary['recordings_per_minute']} recordings/minute")
+    if summary["average_transcode_seconds"] is not None:
+        print(f"  Average transcode:   {summary['average_transcode_seconds']}s")
+    print(f"  Rate-limit retries:  {summary['rate_limit_retries']}")
+    if summary["tokens"]:
+        print(f"  Tokens:              {summary['tokens'].get('prompt_tokens', 0)} prompt "
+              f"({summary['tokens'].get('cached_tokens', 0)} cached), "
+              f"{summary['tokens'].get('completion_tokens', 0)} completion")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade a directory of recordings against a passage.")
+    parser.add_argument("directory", help="Directory containing the recordings")
+    passage_group = parser.add_mutually_exclusive_group(required=True)
+    passage_group.add_argument("--passage", help="The passage that was read")
+    passage_group.add_argument("--passage-file", help="File containing the passage that was read")
+    parser.add_argument("--output", default="results.jsonl",
+                        help="JSON Lines results file; recordings already graded in it are skipped (default: results.jsonl)")
+    parser.add_argument("--native-language", help="Learners' native language")
+    parser.add_argument("--target-language", help="Language being practiced")
+    parser.add_argument("--accent-goal", help="Accent goal for the feedback")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Transcoding processes (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Analysis requests in flight at once (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--requests-per-minute", type=float, default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help=f"Provider request rate limit (default: {DEFAULT_REQUESTS_PER_MINUTE})")
+    args = parser.parse_args(argv)
+
+    if not os.getenv("OPENAI_API_KEY"):
+        print("OPENAI_API_KEY is not set")
+        return 1
+    if not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}")
+        return 1
+    if args.workers < 1 or args.concurrency < 1 or args.requests_per_minute <= 0:
+        print("--workers, --concurrency and --requests-per-minute must be positive")
+        return 1
+
+    if args.passage_file:
+        with open(args.passage_file, encoding='utf-8') as f:
+            passage = f.read().strip()
+    else:
+        passage = args.passage.strip()
+    if not passage:
+        print("The passage is empty")
+        return 1
+
+    recordings = find_recordings(args.directory)
+    if not recordings:
+        print(f"No recordings found in {args.directory}")
+        return 1
+
+    options = {
+        "native_language": args.native_language,
+        "target_language": args.target_language,
+        "accent_goal": args.accent_goal
+    }
+    summary = run_batch(recordings, passage, args.output, options, args.workers,
+                        args.concurrency, args.requests_per_minute)
+    print_summary(summary)
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
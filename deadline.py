@@ -0,0 +1,61 @@
+"""
+Deadline Module
+Per-request deadlines passed down through decoding, transcoding and provider
+calls, so work for a client that has already given up is skipped or cancelled.
+"""
+
+import time
+
+# Default time budget for a Deadline built without an explicit timeout
+DEFAULT_TIMEOUT_SECONDS = 30
+MAX_TIMEOUT_SECONDS = 120
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage cannot start or finish before the request deadline"""
+
+
+class Deadline:
+    """A point in time by which a request must be answered"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_request(cls, header_value=None, body_value=None):
+        """
+        Build a deadline from the X-Request-Timeout header or a "timeout" body field
+
+        Values are in seconds and capped at MAX_TIMEOUT_SECONDS.
+
+        Returns:
+            Deadline: The client's deadline, or None if it sent no valid budget
+        """
+        for value in (header_value, body_value):
+            try:
+                timeout = float(value)
+            except (TypeError, ValueError):
+                continue
+            if timeout > 0:
+                return cls(min(timeout, MAX_TIMEOUT_SECONDS))
+        return None
+
+    def remaining(self):
+        """Seconds left before the deadline, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        """Check whether the deadline has passed"""
+        return self.remaining() <= 0
+
+    def check(self, stage, needed=0):
+        """
+        Raise DeadlineExceeded unless more than `needed` seconds remain
+
+        Args:
+            stage (str): Name of the stage about to run, for the error message
+            needed (float, optional): Minimum seconds the stage needs. Defaults to 0.
+        """
+        if self.remaining() <= needed:
+            raise DeadlineExceeded(f"Request deadline exceeded before {stage}")
@@ -6,15 +6,30 @@ character-level timing and speech generation.
 
 import os
 import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
 from elevenlabs import ElevenLabs
 from dotenv import load_dotenv
 
+from single_flight import SingleFlight
+
 # Load environment variables
 load_dotenv()
 
 # API Configuration
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 DEFAULT_VOICE_ID = "VR6AewLTigWG4xSOukaG"  # Default voice ID
+SPEECH_CACHE_SIZE = int(os.getenv("ELEVENLABS_CACHE_SIZE", "64"))  # Rendered passages kept in memory
+BATCH_MAX_CONCURRENCY = int(os.getenv("ELEVENLABS_BATCH_CONCURRENCY", "4"))  # Parallel batch provider calls per process
+SHARED_CACHE_TTL = 24 * 60 * 60  # Rendered passages kept in the shared state store for a day
+SHARED_CACHE_NAMESPACE = "speech_cache"
+HTTP_TIMEOUT_SECONDS = 240  # The SDK's default request timeout
+# How long idle pooled connections are kept, so connections opened by warm-up
+# are still there when traffic arrives (httpx drops them after 5 s by default)
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("PROVIDER_KEEPALIVE_SECONDS", "300"))
 
 class ElevenLabsService:
     """Service for interacting with ElevenLabs Text-to-Speech API"""
@@ -25,10 +40,144 @@ class ElevenLabsService:
         if not self.api_key:
             raise ValueError("ElevenLabs API key is required")
         
-        # Initialize ElevenLabs client
-        self.client = ElevenLabs(api_key=self.api_key)
+        # Initialize ElevenLabs client, keeping idle connections for HTTP_KEEPALIVE_SECONDS
+        self.client = ElevenLabs(
+            api_key=self.api_key,
+            # Same pool limits as the OpenAI client; follow_redirects matches the SDK's own default client
+            httpx_client=httpx.Client(
+                timeout=HTTP_TIMEOUT_SECONDS,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20,
+                                    keepalive_expiry=HTTP_KEEPALIVE_SECONDS)
+            )
+        )
+
+        # LRU cache of rendered speech keyed on (voice_id, text)
+        self._speech_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
+        # Coalesces identical renders that are in flight at the same time
+        self._in_flight = SingleFlight("elevenlabs")
+        
+        # Shared by all batch requests, so the concurrency cap holds across requests
+        self._batch_executor = ThreadPoolExecutor(
+            max_workers=max(1, BATCH_MAX_CONCURRENCY),
+            thread_name_prefix="elevenlabs-batch"
+        )
+
+    def _shared_cache_key(self, key):
+        """Hash a cache key into a fixed-length shared cache key"""
+        voice_id, text = key
+        return hashlib.sha256(f"{voice_id}\n{text}".encode("utf-8")).hexdigest()
+
+    def _cache_key(self, text, voice_id):
+        """Build the cache key for a rendered passage"""
+        return (voice_id or DEFAULT_VOICE_ID, text.strip())
+
+    def _get_cached(self, text, voice_id, shared_cache=None):
+        """Return cached (audio_data, char_timings) or None"""
+        key = self._cache_key(text, voice_id)
+        with self._cache_lock:
+            entry = self._speech_cache.get(key)
+            if entry is not None:
+                self._speech_cache.move_to_end(key)
+                return entry
+        
+        if shared_cache is not None:
+            shared = shared_cache.get_json(SHARED_CACHE_NAMESPACE, self._shared_cache_key(key))
+            if shared is not None:
+                entry = (base64.b64decode(shared["audio_base64"]), shared["char_timings"])
+                self._store_local(key, entry)
+                return entry
+        
+        return None
+
+    def _store_cached(self, text, voice_id, audio_data, char_timings, shared_cache=None):
+        """Store a rendered passage, evicting the least recently used entry"""
+        key = self._cache_key(text, voice_id)
+        self._store_local(key, (audio_data, char_timings))
+        
+        if shared_cache is not None:
+            shared_cache.set_json(SHARED_CACHE_NAMESPACE, self._shared_cache_key(key), {
+                "audio_base64": base64.b64encode(audio_data).decode("utf-8"),
+                "char_timings": char_timings
+            }, ttl=SHARED_CACHE_TTL)
+
+    def _store_local(self, key, entry):
+        """Add an entry to the in-memory LRU"""
+        with self._cache_lock:
+            self._speech_cache[key] = entry
+            self._speech_cache.move_to_end(key)
+            while len(self._speech_cache) > SPEECH_CACHE_SIZE:
+                self._speech_cache.popitem(last=False)
+
+    def is_cached(self, text, voice_id=None, shared_cache=None):
+        """Check whether a passage has already been rendered with a voice"""
+        return self._get_cached(text, voice_id, shared_cache) is not None
+
+    def _render_with_timestamps(self, text, voice_id):
+        """
+        Call the provider and convert its response to audio bytes and character timings
+        
+        Returns:
+            tuple: (audio_data, char_timings)
+        """
+        # Generate speech with timestamps using the SDK
+        result = self.client.text_to_speech.convert_with_timestamps(
+            voice_id=voice_id,
+            text=text
+        )
+        #print(f"Received response from ElevenLabs API: {result}")
+        
+        # Convert result to dictionary if it's not already
+        if hasattr(result, 'dict'):
+            result = result.dict()
+        
+        # Extract audio data from base64
+        if 'audio_base64' not in result:
+            raise ValueError("No audio_base64 in response")
+        
+        audio_data = base64.b64decode(result['audio_base64'])
+        char_timings = []
+        
+        # Convert timestamp data to our format using the alignment data
+        if 'alignment' not in result:
+            raise ValueError("No alignment data in response")
+        
+        alignment = result['alignment']
+        if 'characters' not in alignment or 'character_start_times_seconds' not in alignment or 'character_end_times_seconds' not in alignment:
+            raise ValueError("Invalid alignment data structure")
+        
+        # Process each character and its timing
+        for i, char in enumerate(alignment['characters']):
+            # Include all characters, including spaces
+            char_timings.append({
+                "char": char,
+                "char_index": i,
+                "start_time": float(alignment['character_start_times_seconds'][i]),
+                "end_time": float(alignment['character_end_times_seconds'][i])
+            })
+        
+        #print(f"Generated {len(char_timings)} character timings")
+        #print("Sample timing data:", char_timings[:5])
+        
+        return audio_data, char_timings
+
+    def _render_and_cache(self, text, voice_id, shared_cache=None):
+        """Render a passage and store it in the cache"""
+        audio_data, char_timings = self._render_with_timestamps(text, voice_id)
+        self._store_cached(text, voice_id, audio_data, char_timings, shared_cache)
+        return audio_data, char_timings
+
+    def _save_audio(self, audio_data, output_path):
+        """Write audio bytes to output_path, creating parent directories"""
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output_path, "wb") as f:
+            f.write(audio_data)
 
-    def generate_speech_with_timestamps(self, text, voice_id=None, output_path=None):
+    def generate_speech_with_timestamps(self, text, voice_id=None, output_path=None, shared_cache=None):
         """
         Generate speech with character-level timestamps
         
@@ -36,64 +185,49 @@ class ElevenLabsService:
             text (str): The text to convert to speech
             voice_id (str, optional): The voice ID to use. Defaults to DEFAULT_VOICE_ID.
             output_path (str, optional): Path to save audio file. Defaults to None.
+            shared_cache (SQLiteStateStore, optional): Cross-process cache behind the
+                in-memory LRU, so workers share rendered speech. Defaults to None.
             
         Returns:
             dict: Response containing audio URL and character timing data
         """
+        return self._generate(text, voice_id or DEFAULT_VOICE_ID, output_path, shared_cache=shared_cache)
+
+    def _generate(self, text, voice_id, output_path=None, cached=None, shared_cache=None):
+        """
+        Body of generate_speech_with_timestamps
+        
+        cached is an entry the caller already read with _get_cached, so the
+        shared cache isn't read and decoded a second time.
+        """
         try:
-            voice_id = voice_id or DEFAULT_VOICE_ID
             #print(f"Generating speech for text: {text[:50]}...")
             
-            # Generate speech with timestamps using the SDK
-            result = self.client.text_to_speech.convert_with_timestamps(
-                voice_id=voice_id,
-                text=text
-            )
-            #print(f"Received response from ElevenLabs API: {result}")
-            
-            # Convert result to dictionary if it's not already
-            if hasattr(result, 'dict'):
-                result = result.dict()
-            
-            # Extract audio data from base64
-            if 'audio_base64' not in result:
-                raise ValueError("No audio_base64 in response")
-            
-            audio_data = base64.b64decode(result['audio_base64'])
-            char_timings = []
-            
-            # Convert timestamp data to our format using the alignment data
-            if 'alignment' not in result:
-                raise ValueError("No alignment data in response")
-            
-            alignment = result['alignment']
-            if 'characters' not in alignment or 'character_start_times_seconds' not in alignment or 'character_end_times_seconds' not in alignment:
-                raise ValueError("Invalid alignment data structure")
-            
-            # Process each character and its timing
-            for i, char in enumerate(alignment['characters']):
-                # Include all characters, including spaces
-                char_timings.append({
-                    "char": char,
-                    "char_index": i,
-                    "start_time": float(alignment['character_start_times_seconds'][i]),
-                    "end_time": float(alignment['character_end_times_seconds'][i])
-                })
-            
-            #print(f"Generated {len(char_timings)} character timings")
-            #print("Sample timing data:", char_timings[:5])
+            # Serve previously rendered passages without calling the provider
+            if cached is None:
+                cached = self._get_cached(text, voice_id, shared_cache)
+            coalesced = False
+            if cached is not None:
+                audio_data, char_timings = cached
+            else:
+                # Identical concurrent requests wait on a single provider call
+                (audio_data, char_timings), coalesced = self._in_flight.do(
+                    self._cache_key(text, voice_id),
+                    lambda: self._render_and_cache(text, voice_id, shared_cache)
+                )
             
             # Save the audio if output path is provided
             if output_path:
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                with open(output_path, "wb") as f:
-                    f.write(audio_data)
+                self._save_audio(audio_data, output_path)
                 print(f"Saved audio to {output_path}")
             
             return {
                 "success": True,
+                "voice_id": voice_id,
                 "audio_path": output_path,
-                "char_timings": char_timings
+                "char_timings": char_timings,
+                "cached": cached is not None,
+                "coalesced": coalesced
             }
         
         except Exception as e:
@@ -103,9 +237,62 @@ class ElevenLabsService:
             print(f"Traceback: {traceback.format_exc()}")
             return {
                 "success": False,
+                "voice_id": voice_id,
                 "error": str(e)
             }
 
+    def generate_speech_batch(self, text, voice_ids, output_path_for=None, max_concurrency=None, shared_cache=None):
+        """
+        Render one passage with several voices concurrently
+        
+        Results are yielded as each voice completes. Voices that are already
+        cached are yielded first without any provider call. Renders run on an
+        executor shared by all batch requests, so at most BATCH_MAX_CONCURRENCY
+        provider calls are made at once across the process.
+        
+        Args:
+            text (str): The text to convert to speech
+            voice_ids (list): Voice IDs to render; duplicates are ignored
+            output_path_for (callable, optional): Maps a voice ID to the path its audio
+                should be saved to. Defaults to None (audio is not saved).
+            max_concurrency (int, optional): Cap on this request's share of the
+                parallel provider calls. Defaults to BATCH_MAX_CONCURRENCY.
+            shared_cache (SQLiteStateStore, optional): Cross-process speech cache.
+                Defaults to None.
+            
+        Yields:
+            dict: Per-voice result in the same format as generate_speech_with_timestamps
+        """
+        # Preserve request order while dropping duplicates
+        unique_voice_ids = list(dict.fromkeys(voice_ids or [DEFAULT_VOICE_ID]))
+        max_concurrency = max(1, min(max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+        
+        def render(voice_id, cached=None):
+            output_path = output_path_for(voice_id) if output_path_for else None
+            return self._generate(text, voice_id, output_path, cached, shared_cache)
+        
+        pending = []
+        for voice_id in unique_voice_ids:
+            cached = self._get_cached(text, voice_id, shared_cache)
+            if cached is not None:
+                yield render(voice_id, cached)
+            else:
+                pending.append(voice_id)
+        
+        # Keep at most max_concurrency of this request's renders queued or running
+        in_flight = set()
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < max_concurrency:
+                    in_flight.add(self._batch_executor.submit(render, pending.pop(0)))
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            # Drop queued renders if the consumer stops early (e.g. client disconnect)
+            for future in in_flight:
+                future.cancel()
+
     def generate_speech(self, text, voice_id=None, output_path=None):
         """
         Generate speech without timestamps (simpler version)
@@ -0,0 +1,198 @@
+"""
+Learner History Module
+Stores the scores from each parsed analysis so learners and teachers can see
+progress over time. Scores are kept one row per session, with one column per
+category, indexed by learner, passage and date so trend and percentile queries
+stay fast over thousands of sessions.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+# Default location of the history database, relative to the project root
+DEFAULT_HISTORY_DB_PATH = os.path.join(os.path.dirname(__file__), 'instance', 'learner_history.db')
+
+# Score categories that OpenAIService.parse_detailed_feedback fills in
+SCORE_CATEGORIES = ["pronunciation", "fluency", "grammar", "voice_quality", "overall"]
+
+
+def passage_hash(passage):
+    """Identify a passage independently of surrounding and repeated whitespace"""
+    normalized = " ".join(passage.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+class LearnerHistoryStore:
+    """SQLite-backed store of per-session analysis scores"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv("HISTORY_DB_PATH") or DEFAULT_HISTORY_DB_PATH
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id INTEGER PRIMARY KEY,
+                    learner_id TEXT NOT NULL,
+                    passage_hash TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    day TEXT NOT NULL,
+                    {", ".join(f"{category} REAL" for category in SCORE_CATEGORIES)},
+                    accent_identification TEXT,
+                    accent_intensity TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_learner ON sessions (learner_id, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_learner_passage ON sessions (learner_id, passage_hash, created_at)")
+            # Percentile and distribution queries count and offset into these per category
+            for category in SCORE_CATEGORIES:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS sessions_passage_{category} ON sessions (passage_hash, {category})")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS sessions_{category} ON sessions ({category})")
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _check_category(self, category):
+        """Only allow known score columns in queries"""
+        if category not in SCORE_CATEGORIES:
+            raise ValueError(f"Unknown score category: {category}")
+
+    def record(self, learner_id, passage, feedback, created_at=None):
+        """
+        Store the scores from one parsed analysis
+
+        Args:
+            learner_id (str): Learner the session belongs to
+            passage (str): The passage that was read
+            feedback (dict): Output of OpenAIService.parse_detailed_feedback
+            created_at (float, optional): Unix timestamp. Defaults to now.
+
+        Returns:
+            int: The new session ID
+        """
+        created_at = created_at or time.time()
+        day = datetime.fromtimestamp(created_at, tz=timezone.utc).strftime("%Y-%m-%d")
+        scores = [(feedback.get(category) or {}).get("score") for category in SCORE_CATEGORIES]
+        accent = feedback.get("accent") or {}
+
+        cursor = self._connect().execute(
+            f"INSERT INTO sessions (learner_id, passage_hash, created_at, day, {', '.join(SCORE_CATEGORIES)}, "
+            f"accent_identification, accent_intensity) VALUES ({', '.join('?' * (len(SCORE_CATEGORIES) + 6))})",
+            [learner_id, passage_hash(passage), created_at, day, *scores,
+             accent.get("identification", ""), accent.get("intensity", "")]
+        )
+        return cursor.lastrowid
+
+    def history(self, learner_id, passage=None, limit=50):
+        """Return a learner's most recent sessions, newest first"""
+        query = "SELECT * FROM sessions WHERE learner_id = ?"
+        params = [learner_id]
+        if passage:
+            query += " AND passage_hash = ?"
+            params.append(passage_hash(passage))
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def trend(self, learner_id, passage=None, days=None):
+        """
+        Return a learner's average scores per day, oldest first
+
+        Args:
+            learner_id (str): Learner to report on
+            passage (str, optional): Only include sessions for this passage. Defaults to None.
+            days (int, optional): Only include the last N days. Defaults to None (all).
+        """
+        averages = ", ".join(f"ROUND(AVG({category}), 2) AS {category}" for category in SCORE_CATEGORIES)
+        query = f"SELECT day, COUNT(*) AS sessions, {averages} FROM sessions WHERE learner_id = ?"
+        params = [learner_id]
+        if passage:
+            query += " AND passage_hash = ?"
+            params.append(passage_hash(passage))
+        if days:
+            query += " AND created_at >= ?"
+            params.append(time.time() - days * 24 * 60 * 60)
+        query += " GROUP BY day ORDER BY day"
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def percentile(self, learner_id, passage=None, category="overall"):
+        """
+        Rank a learner's latest score against all recorded sessions
+
+        Returns:
+            dict: {"score", "percentile", "sessions"}, where percentile is the share of
+                sessions scoring below the learner's latest score. Score and percentile
+                are None if the learner has no scored session.
+        """
+        self._check_category(category)
+        conn = self._connect()
+        scope = ""
+        params = []
+        if passage:
+            scope = " AND passage_hash = ?"
+            params.append(passage_hash(passage))
+
+        latest = conn.execute(
+            f"SELECT {category} FROM sessions WHERE learner_id = ? AND {category} IS NOT NULL{scope} "
+            f"ORDER BY created_at DESC LIMIT 1",
+            [learner_id, *params]
+        ).fetchone()
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM sessions WHERE {category} IS NOT NULL{scope}", params
+        ).fetchone()[0]
+        if latest is None:
+            return {"score": None, "percentile": None, "sessions": total}
+
+        score = latest[0]
+        below = conn.execute(
+            f"SELECT COUNT(*) FROM sessions WHERE {category} < ?{scope}", [score, *params]
+        ).fetchone()[0]
+        return {
+            "score": score,
+            "percentile": round(100 * below / total, 1),
+            "sessions": total
+        }
+
+    def distribution(self, passage=None, category="overall", quantiles=(25, 50, 75, 90)):
+        """Return score quantiles across all sessions, e.g. {"p50": 7.5}"""
+        self._check_category(category)
+        conn = self._connect()
+        scope = ""
+        params = []
+        if passage:
+            scope = " AND passage_hash = ?"
+            params.append(passage_hash(passage))
+
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM sessions WHERE {category} IS NOT NULL{scope}", params
+        ).fetchone()[0]
+        result = {}
+        for q in quantiles:
+            if total == 0:
+                result[f"p{q}"] = None
+                continue
+            # Nearest-rank quantile, read straight off the (passage, score) index
+            offset = max(0, min(total - 1, -(-q * total // 100) - 1))
+            row = conn.execute(
+                f"SELECT {category} FROM sessions WHERE {category} IS NOT NULL{scope} "
+                f"ORDER BY {category} LIMIT 1 OFFSET ?",
+                [*params, offset]
+            ).fetchone()
+            result[f"p{q}"] = row[0]
+        return result
@@ -0,0 +1,54 @@
+"""
+Metrics Module
+Named counters for provider usage and request handling. Increments are buffered
+in process memory, so recording a metric never touches the database on the
+request path; each worker periodically flushes its buffer into the shared state
+store in one transaction, so /metrics reports totals across all workers on a node.
+"""
+
+import threading
+
+STATE_NAMESPACE = "metrics"
+
+
+class Metrics:
+    """Simple counter registry"""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        """Add amount to a counter"""
+        if not amount:
+            return
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + amount
+
+    def flush(self, state_store):
+        """Add buffered increments to the totals in a state store"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            state_store.incr_many(STATE_NAMESPACE, pending)
+        except Exception as e:
+            # Metrics must never fail a request; keep the increments for the next flush
+            print(f"Error flushing metrics: {e}")
+            with self._lock:
+                for name, amount in pending.items():
+                    self._pending[name] = self._pending.get(name, 0) + amount
+
+    def snapshot(self, state_store=None):
+        """Return all counters as a dict, including this process's unflushed increments"""
+        with self._lock:
+            counters = dict(self._pending)
+        if state_store is not None:
+            for name, value in state_store.items(STATE_NAMESPACE):
+                counters[name] = counters.get(name, 0) + int(value)
+        return counters
+
+
+# Singleton instance
+metrics = Metrics()
@@ -7,52 +7,31 @@ using GPT-4o-audio-preview models.
 import os
 import json
 import base64
+import hashlib
 import re
-import subprocess
 from dotenv import load_dotenv
-from openai import OpenAI
+import httpx
+from openai import OpenAI, APITimeoutError, DefaultHttpxClient
+
+from alignment import compare_transcript
+from metrics import metrics
+from single_flight import SingleFlight
+from deadline import DeadlineExceeded
+from transcoding import convert_to_mp3
 
 # Load environment variables
 load_dotenv()
 
 # API Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+ANALYSIS_MODEL = "gpt-4o-audio-preview"
 
-class OpenAIService:
-    """Service for interacting with OpenAI APIs"""
+# How long idle pooled connections are kept, so connections opened by warm-up
+# are still there when traffic arrives (httpx drops them after 5 s by default)
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("PROVIDER_KEEPALIVE_SECONDS", "300"))
 
-    def __init__(self, api_key=None):
-        """Initialize with API key"""
-        self.api_key = api_key or OPENAI_API_KEY
-        if not self.api_key:
-            raise ValueError("OpenAI API key is required")
-        
-        # Initialize the OpenAI client
-        self.client = OpenAI(api_key=self.api_key)
-        print(f"OpenAI service initialized with API key: {self.api_key[:4]}...{self.api_key[-4:] if len(self.api_key) > 8 else '****'}")
-
-    def analyze_speech(self, audio_file_path, text_passage, native_language=None, target_language=None, accent_goal=None, prompt=None):
-        """
-        Analyze speech recording against the text passage
-        
-        Args:
-            audio_file_path (str): Path to the audio file to analyze
-            text_passage (str): The original text passage that was read
-            native_language (str, optional): User's native language. Defaults to None.
-            target_language (str, optional): Language user is practicing. Defaults to None.
-            accent_goal (str, optional): User's accent goal. Defaults to None.
-            prompt (str, optional): Custom prompt for the analysis. Defaults to None.
-            
-        Returns:
-            dict: Structured feedback on pronunciation, rhythm, clarity, etc.
-        """
-        try:
-            # Ensure the audio file exists
-            if not os.path.exists(audio_file_path):
-                raise FileNotFoundError(f"Audio file not found: {audio_file_path}")
-            
-            # Enhanced system prompt based on the provided detailed speech analysis parameters
-            system_prompt = """You are a Speech Therapist and will be given an audio recording to analyze and give your feedback. 
+# Enhanced system prompt based on the provided detailed speech analysis parameters
+SYSTEM_PROMPT = """You are a Speech Therapist and will be given an audio recording to analyze and give your feedback. 
 To ensure a proper analysis you will analyze the following aspects:
 
 1. Pronunciation: 
@@ -82,112 +61,33 @@ To ensure a proper analysis you will analyze the following aspects:
    - Clarity and resonance
 
 Provide detailed, constructive feedback that is helpful, specific, and encouraging."""
-            
-            # User prompt with context - enhanced with more specific reading task
-            if prompt is None:
-                # Format language context information
-                language_context = ""
-                if native_language and target_language:
-                    language_context = f"The speaker's native language is {native_language} and they are practicing {target_language}. "
-                elif native_language:
-                    language_context = f"The speaker's native language is {native_language}. "
-                elif target_language:
-                    language_context = f"The speaker is practicing {target_language}. "
-                
-                # Format accent goal information
-                accent_context = ""
-                if accent_goal:
-                    if accent_goal == "identify":
-                        accent_context = "Please identify their current accent. "
-                    elif accent_goal == "minimize":
-                        accent_context = "They want to minimize their accent. "
-                    else:
-                        accent_context = f"They are aiming for a {accent_goal} accent. "
-                
-                user_prompt = f"""
-                {language_context}{accent_context}Here's the text the user was reading:
-                
-                "{text_passage}"
-                
-                Please analyze their speech and provide detailed feedback on:
-                
-                1. Pronunciation (accuracy of sounds, articulation, word stress): Score out of 10 and specific details
-                2. Fluency and Coherence (pace, pauses, organization): Score out of 10 and specific details
-                3. Grammar and Vocabulary (if applicable): Score out of 10 and specific details
-                4. Voice Quality (pitch, tone, clarity): Score out of 10 and specific details
-                5. Accent Analysis: Identify the accent type and intensity
-                6. Compare what user said in comparison to the text passage
-                
-                For each category:
-                - Provide a brief summary of strengths and areas for improvement
-                - Include 2-3 specific examples from the recording
-                - Suggest practical tips or exercises to improve
-                
-                Also identify any accent patterns and provide an overall score with a summary of strengths and suggestions.
-                Keep your feedback helpful, specific, and encouraging.
-                """
-            else:
-                user_prompt = prompt
-            
-            print(f"Analyzing speech recording at: {audio_file_path}")
-            print(f"Text passage length: {len(text_passage)} characters")
-            if native_language or target_language or accent_goal:
-                print(f"Language context: Native={native_language}, Target={target_language}, Accent Goal={accent_goal}")
-
-            # Convert to MP3 using ffmpeg
-            output_mp3 = "temp_output.mp3"
-            subprocess.run([
-                "ffmpeg", 
-                "-i", audio_file_path, 
-                "-codec:a", "libmp3lame", 
-                "-qscale:a", "2", 
-                output_mp3
-            ], check=True)
-            
-            # Read the converted MP3 file
-            with open(output_mp3, "rb") as f:
-                mp3_data = f.read()
-            
-            # Clean up temporary file
-            os.remove(output_mp3)
-            
-            try:
-                print("Creating API request to OpenAI using SDK")
-                
-                # Base64 encode the MP3 file
-                audio_base64 = base64.b64encode(mp3_data).decode('utf-8')
-                
-                # Make the API call using the client library
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-audio-preview",
-                    messages=[
-                        {"role": "system", "content": [{"type": "text", "text": system_prompt}]},
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": user_prompt},
-                                {
-                                    "type": "input_audio",
-                                    "input_audio":  {
-                                        "data": audio_base64,
-                                        "format": "mp3",
-                                    },
-                                }
-                            ]
-                        }
-                    ],
-                    temperature=0.7
-                )
-                
-                print("Successfully received feedback")
-                
-                # Extract the text content from the response
-                feedback_text = response.choices[0].message.content
-                
-                # If the feedback is empty or contains null values, try to get more detailed feedback
-                if "null/10" in feedback_text or "No details provided" in feedback_text:
-                    # Make another request with a more specific prompt
-                    detailed_prompt = f"""Please provide a detailed analysis of the speech recording. Include specific scores and examples for each category:
+
+# Fixed analysis instructions. The prompt is ordered system prompt, these
+# instructions, the passage, then the learner's language and accent context, so
+# everyone reading the same passage shares the longest possible prefix. The fixed
+# part alone is only about 450 tokens, below the provider's 1,024-token minimum
+# for prompt caching, so cached_tokens stays 0 unless the passage is long enough
+# (roughly 2,500+ characters) to push the shared prefix past that threshold.
+ANALYSIS_INSTRUCTIONS = """Please analyze the speaker's reading of the passage given below and provide detailed feedback on:
+
+1. Pronunciation (accuracy of sounds, articulation, word stress): Score out of 10 and specific details
+2. Fluency and Coherence (pace, pauses, organization): Score out of 10 and specific details
+3. Grammar and Vocabulary (if applicable): Score out of 10 and specific details
+4. Voice Quality (pitch, tone, clarity): Score out of 10 and specific details
+5. Accent Analysis: Identify the accent type and intensity
+6. Transcript: Write down word for word what the speaker actually said, including misread, repeated or skipped words
+
+For each category:
+- Provide a brief summary of strengths and areas for improvement
+- Include 2-3 specific examples from the recording
+- Suggest practical tips or exercises to improve
+
+Also identify any accent patterns and provide an overall score with a summary of strengths and suggestions.
+End with the transcript as a single paragraph under a "Transcript:" heading, after the overall score.
+Keep your feedback helpful, specific, and encouraging."""
+
+# Fallback prompt used when the first response contains empty scores
+DETAILED_PROMPT = """Please provide a detailed analysis of the speech recording. Include specific scores and examples for each category:
 
 1. Pronunciation (0-10):
    - Specific examples of correct/incorrect pronunciations
@@ -216,36 +116,231 @@ Provide detailed, constructive feedback that is helpful, specific, and encouragi
    - Describe its intensity
    - Specific characteristics
 
+6. Transcript:
+   - Word for word what the speaker actually said, as a single paragraph
+
 Please provide concrete examples and specific suggestions for improvement."""
 
-                    response = self.client.chat.completions.create(
-                        model="gpt-4o-audio-preview",
-                        messages=[
-                            {"role": "system", "content": [{"type": "text", "text": system_prompt}]},
-                            {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": detailed_prompt},
-                                    {
-                                        "type": "input_audio",
-                                        "input_audio":  {
-                                            "data": audio_base64,
-                                            "format": "mp3",
-                                        },
-                                    }
-                                ]
-                            }
-                        ],
-                        temperature=0.7
-                    )
-                    feedback_text = response.choices[0].message.content
-                
-                # Parse the response into structured feedback
-                feedback = self.parse_detailed_feedback(feedback_text)
+# Minimum time budget worth starting a provider call with, in seconds
+MIN_PROVIDER_CALL_SECONDS = 5
+
+# Feedback sections in the order the model is asked to produce them: (key, heading)
+FEEDBACK_SECTIONS = [
+    ("pronunciation", "Pronunciation"),
+    ("fluency", "Fluency"),
+    ("grammar", "Grammar"),
+    ("voice_quality", "Voice Quality"),
+    ("accent", "Accent"),
+    ("overall", "Overall"),
+    ("transcript", "Transcript"),
+]
+
+# Sections that run from their heading to the end of the text rather than the next
+# blank line; the transcript comes last and may be separated from its heading by one
+OPEN_ENDED_SECTIONS = {"transcript"}
+
+class OpenAIService:
+    """Service for interacting with OpenAI APIs"""
+
+    def __init__(self, api_key=None):
+        """Initialize with API key"""
+        self.api_key = api_key or OPENAI_API_KEY
+        if not self.api_key:
+            raise ValueError("OpenAI API key is required")
+        
+        # Initialize the OpenAI client, keeping idle connections for HTTP_KEEPALIVE_SECONDS
+        self.client = OpenAI(
+            api_key=self.api_key,
+            http_client=DefaultHttpxClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20,
+                                    keepalive_expiry=HTTP_KEEPALIVE_SECONDS)
+            )
+        )
+        
+        # Coalesces identical analyses that are in flight at the same time
+        self._in_flight = SingleFlight("openai")
+        print(f"OpenAI service initialized with API key: {self.api_key[:4]}...{self.api_key[-4:] if len(self.api_key) > 8 else '****'}")
+
+    def _build_passage_context(self, text_passage):
+        """Build the passage part of the prompt, shared by every learner reading it"""
+        return f'Here\'s the text the user was reading:\n\n"{text_passage}"'
+
+    def _build_learner_context(self, native_language=None, target_language=None, accent_goal=None):
+        """Build the per-learner part of the prompt: language context and accent goal"""
+        # Format language context information
+        language_context = ""
+        if native_language and target_language:
+            language_context = f"The speaker's native language is {native_language} and they are practicing {target_language}. "
+        elif native_language:
+            language_context = f"The speaker's native language is {native_language}. "
+        elif target_language:
+            language_context = f"The speaker is practicing {target_language}. "
+        
+        # Format accent goal information
+        accent_context = ""
+        if accent_goal:
+            if accent_goal == "identify":
+                accent_context = "Please identify their current accent. "
+            elif accent_goal == "minimize":
+                accent_context = "They want to minimize their accent. "
+            else:
+                accent_context = f"They are aiming for a {accent_goal} accent. "
+        
+        return f"{language_context}{accent_context}".strip()
+
+    def _build_messages(self, prompt_parts, audio_base64):
+        """
+        Build the chat messages for an analysis request
+        
+        Args:
+            prompt_parts (list): User prompt text parts, ordered from most to least stable
+            audio_base64 (str): The recording as base64-encoded MP3
+        """
+        return [
+            {"role": "system", "content": [{"type": "text", "text": SYSTEM_PROMPT}]},
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": part} for part in prompt_parts] + [
+                    {
+                        "type": "input_audio",
+                        "input_audio":  {
+                            "data": audio_base64,
+                            "format": "mp3",
+                        },
+                    }
+                ]
+            }
+        ]
+
+    def _extract_usage(self, usage):
+        """Convert a response usage object into token counts"""
+        counts = {
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "audio_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0
+        }
+        if usage is None:
+            return counts
+        
+        counts["prompt_tokens"] = getattr(usage, "prompt_tokens", 0) or 0
+        counts["completion_tokens"] = getattr(usage, "completion_tokens", 0) or 0
+        counts["total_tokens"] = getattr(usage, "total_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        if details is not None:
+            counts["cached_tokens"] = getattr(details, "cached_tokens", 0) or 0
+            counts["audio_tokens"] = getattr(details, "audio_tokens", 0) or 0
+        return counts
+
+    def _record_usage(self, total, usage):
+        """Add one response's token counts to a request total and to the metrics"""
+        counts = self._extract_usage(usage)
+        metrics.incr("openai.requests")
+        for key, value in counts.items():
+            total[key] = total.get(key, 0) + value
+            metrics.incr(f"openai.{key}", value)
+        print(f"OpenAI usage: {counts['prompt_tokens']} prompt ({counts['cached_tokens']} cached, "
+              f"{counts['audio_tokens']} audio), {counts['completion_tokens']} completion")
+        return total
+
+    def _create_completion(self, deadline, stage, **kwargs):
+        """
+        Make a chat completion call bounded by the request deadline
+        
+        With a deadline, the call is skipped unless MIN_PROVIDER_CALL_SECONDS remain,
+        gets the remaining time as its timeout, and is not retried by the SDK (its
+        retries would each get the full timeout again). A provider timeout is raised
+        as DeadlineExceeded.
+        """
+        if deadline is None:
+            return self.client.chat.completions.create(**kwargs)
+        
+        deadline.check(stage, needed=MIN_PROVIDER_CALL_SECONDS)
+        client = self.client.with_options(max_retries=0, timeout=deadline.remaining())
+        try:
+            return client.chat.completions.create(**kwargs)
+        except APITimeoutError:
+            raise DeadlineExceeded(f"Request deadline exceeded during {stage}")
+
+    def _needs_detailed_retry(self, feedback_text):
+        """Check whether the feedback is empty or contains null values"""
+        return "null/10" in feedback_text or "No details provided" in feedback_text
+
+    def _prepare_analysis(self, audio_file_path, text_passage, native_language, target_language, accent_goal, prompt, mp3_data=None, deadline=None):
+        """
+        Build the user prompt and encode the recording for an analysis request
+        
+        Returns:
+            tuple: (prompt_parts, audio_base64)
+        """
+        # Fixed instructions, then the passage, then per-learner context, so the prefix stays cacheable
+        if prompt is None:
+            prompt_parts = [ANALYSIS_INSTRUCTIONS, self._build_passage_context(text_passage)]
+            learner_context = self._build_learner_context(native_language, target_language, accent_goal)
+            if learner_context:
+                prompt_parts.append(learner_context)
+        else:
+            prompt_parts = [prompt]
+        
+        print(f"Analyzing speech recording at: {audio_file_path or 'uploaded MP3'}")
+        print(f"Text passage length: {len(text_passage)} characters")
+        if native_language or target_language or accent_goal:
+            print(f"Language context: Native={native_language}, Target={target_language}, Accent Goal={accent_goal}")
+
+        # Convert to MP3 using ffmpeg unless the caller already has MP3 data
+        if mp3_data is None:
+            mp3_data = convert_to_mp3(audio_file_path, deadline)
+        
+        # Base64 encode the MP3 file
+        audio_base64 = base64.b64encode(mp3_data).decode('utf-8')
+        return prompt_parts, audio_base64
+
+    def analyze_speech(self, audio_file_path, text_passage, native_language=None, target_language=None, accent_goal=None, prompt=None, mp3_data=None, deadline=None, char_timings=None):
+        """
+        Analyze speech recording against the text passage
+        
+        Args:
+            audio_file_path (str): Path to the audio file to analyze
+            text_passage (str): The original text passage that was read
+            native_language (str, optional): User's native language. Defaults to None.
+            target_language (str, optional): Language user is practicing. Defaults to None.
+            accent_goal (str, optional): User's accent goal. Defaults to None.
+            prompt (str, optional): Custom prompt for the analysis. Defaults to None.
+            mp3_data (bytes, optional): Recording already converted to MP3; skips the
+                ffmpeg conversion of audio_file_path. Defaults to None.
+            deadline (Deadline, optional): Request deadline. Transcoding and provider
+                calls are bounded by it, and stages that can no longer finish in time
+                raise DeadlineExceeded. Defaults to None.
+            char_timings (list, optional): Character timings of the passage audio from
+                ElevenLabs, used to timestamp words in the reading accuracy report.
+                Defaults to None.
+            
+        Returns:
+            dict: Structured feedback on pronunciation, rhythm, clarity, etc. (with a
+                word-level reading accuracy report when a transcript was returned), the
+                token usage of the provider calls made for it, and whether the result was
+                shared with an identical in-flight request.
+        """
+        try:
+            prompt_parts, audio_base64 = self._prepare_analysis(
+                audio_file_path, text_passage, native_language, target_language, accent_goal, prompt, mp3_data, deadline
+            )
+            
+            try:
+                # Identical concurrent requests (same prompt and recording) share one set of provider calls
+                (feedback, usage), coalesced = self._in_flight.do(
+                    self._request_key(prompt_parts, audio_base64),
+                    lambda: self._request_feedback(prompt_parts, audio_base64, deadline),
+                    timeout=deadline.remaining() if deadline is not None else None
+                )
                 
+                # A coalesced request made no provider calls of its own
                 return {
                     "success": True,
-                    "feedback": feedback
+                    "feedback": self.add_reading_accuracy(feedback, text_passage, char_timings),
+                    "usage": {key: 0 for key in usage} if coalesced else dict(usage),
+                    "coalesced": coalesced
                 }
             except Exception as e:
                 print(f"API call failed: {e}")
@@ -259,7 +354,253 @@ Please provide concrete examples and specific suggestions for improvement."""
             import traceback
             print(f"Traceback: {traceback.format_exc()}")
             raise e
-    
+
+    def _request_key(self, prompt_parts, audio_base64):
+        """Key identical analysis requests on model, prompt and recording"""
+        digest = hashlib.sha256()
+        for part in [ANALYSIS_MODEL, *prompt_parts, audio_base64]:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _request_feedback(self, prompt_parts, audio_base64, deadline=None):
+        """
+        Make the analysis provider calls and parse the result
+        
+        Returns:
+            tuple: (feedback, usage)
+        """
+        print("Creating API request to OpenAI using SDK")
+        
+        # Make the API call using the client library
+        response = self._create_completion(
+            deadline,
+            "analysis",
+            model=ANALYSIS_MODEL,
+            messages=self._build_messages(prompt_parts, audio_base64),
+            temperature=0.7
+        )
+        
+        print("Successfully received feedback")
+        usage = self._record_usage({}, response.usage)
+        
+        # Extract the text content from the response
+        feedback_text = response.choices[0].message.content
+        
+        # If the feedback is empty or contains null values, try to get more detailed feedback
+        if self._needs_detailed_retry(feedback_text):
+            # Make another request with a more specific prompt, if there is still time for it
+            response = self._create_completion(
+                deadline,
+                "detailed analysis retry",
+                model=ANALYSIS_MODEL,
+                messages=self._build_messages([DETAILED_PROMPT], audio_base64),
+                temperature=0.7
+            )
+            self._record_usage(usage, response.usage)
+            feedback_text = response.choices[0].message.content
+        
+        # Parse the response into structured feedback
+        return self.parse_detailed_feedback(feedback_text), usage
+
+    def _stream_sections(self, prompt_parts, audio_base64, usage, deadline=None, stage="analysis"):
+        """
+        Stream one analysis request, yielding section events as their headings complete
+        
+        Token counts from the final chunk are added to usage. The provider stream is
+        always closed on exit, including when the consumer stops early (for example
+        the browser disconnects and the generator is closed), so a stream is
+        cancelled by disconnect rather than by the wall clock. With a deadline,
+        DeadlineExceeded is raised if the stream can't start in time or stalls.
+        
+        Returns:
+            str: The full feedback text, as the generator's return value
+        """
+        parser = IncrementalFeedbackParser(self)
+        stream = self._create_completion(
+            deadline,
+            stage,
+            model=ANALYSIS_MODEL,
+            messages=self._build_messages(prompt_parts, audio_base64),
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            for chunk in stream:
+                # The last chunk carries usage and no choices
+                if getattr(chunk, "usage", None) is not None:
+                    self._record_usage(usage, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    for key, section in parser.feed(delta):
+                        yield {"event": "section", "section": key, "data": section}
+        except (APITimeoutError, httpx.TimeoutException):
+            # A read waited longer than the deadline-derived timeout
+            if deadline is None:
+                raise
+            raise DeadlineExceeded(f"Request deadline exceeded during {stage}")
+        finally:
+            # Release the provider connection now rather than when garbage-collected
+            stream.close()
+        for key, section in parser.finish():
+            yield {"event": "section", "section": key, "data": section}
+        return parser.text
+
+    def analyze_speech_stream(self, audio_file_path, text_passage, native_language=None, target_language=None, accent_goal=None, prompt=None, mp3_data=None, deadline=None, char_timings=None):
+        """
+        Analyze speech recording, yielding feedback sections as they are generated
+        
+        Takes the same arguments as analyze_speech.
+        
+        Yields:
+            dict: {"event": "section", "section": key, "data": {...}} for each completed
+                section, then {"event": "complete", "feedback": {...}, "usage": {...}} with
+                the full structured feedback and token usage. If the fallback prompt is used, sections are sent
+                again and replace the earlier ones.
+        """
+        prompt_parts, audio_base64 = self._prepare_analysis(
+            audio_file_path, text_passage, native_language, target_language, accent_goal, prompt, mp3_data, deadline
+        )
+        
+        print("Creating streaming API request to OpenAI using SDK")
+        usage = {}
+        feedback_text = yield from self._stream_sections(prompt_parts, audio_base64, usage, deadline)
+        
+        # If the feedback is empty or contains null values, try to get more detailed feedback
+        if self._needs_detailed_retry(feedback_text):
+            yield {"event": "retry"}
+            feedback_text = yield from self._stream_sections([DETAILED_PROMPT], audio_base64, usage, deadline, "detailed analysis retry")
+        
+        print("Successfully received streamed feedback")
+        feedback = self.add_reading_accuracy(self.parse_detailed_feedback(feedback_text), text_passage, char_timings)
+        yield {"event": "complete", "feedback": feedback, "usage": usage}
+
+    def _parse_score(self, section_text):
+        """Extract a score out of 10 from a section, or None if absent"""
+        # First try decimal format
+        score_match = re.search(r'(\d+\.\d+)(?:/10)', section_text)
+        if score_match:
+            # Handle decimal scores directly
+            return float(score_match.group(1))
+        
+        # Then try integer format
+        score_match = re.search(r'(\d+)(?:/10)', section_text)
+        if score_match:
+            score_value = int(score_match.group(1))
+            # Handle incorrectly formatted scores (e.g., 75/10 should be 7.5/10)
+            if score_value > 10:
+                score_value = score_value / 10
+            return round(score_value, 1)
+        
+        return None
+
+    def _parse_scored_section(self, section_text):
+        """Parse a category section into score, details and tips"""
+        return {
+            "score": self._parse_score(section_text),
+            "details": self._extract_content(section_text, ["details", "examples", "issues"]),
+            "tips": self._extract_content(section_text, ["tips", "exercises", "improve", "practice"])
+        }
+
+    def _parse_accent_section(self, accent_section):
+        """Parse the accent section into identification and intensity"""
+        accent = {"identification": "", "intensity": ""}
+        
+        # Try to find accent identification
+        identification_patterns = [
+            r'(?:sounds like|appears to be|identified as|similar to|characteristic of)\s+([A-Za-z\s]+)(?:accent|speaker)',
+            r'accent[:\s]+([A-Za-z\s]+)',
+            r'([A-Za-z\s]+)(?:\s+accent)'
+        ]
+        
+        for pattern in identification_patterns:
+            accent_id_match = re.search(pattern, accent_section, re.IGNORECASE)
+            if accent_id_match:
+                accent["identification"] = accent_id_match.group(1).strip()
+                break
+        
+        # Try to find accent intensity
+        intensity_patterns = [
+            r'(strong|moderate|light|minor|thick|heavy|slight|noticeable)',
+            r'accent is (strong|moderate|light|minor|thick|heavy|slight|noticeable)'
+        ]
+        
+        for pattern in intensity_patterns:
+            intensity_match = re.search(pattern, accent_section, re.IGNORECASE)
+            if intensity_match:
+                accent["intensity"] = intensity_match.group(1).strip().capitalize()
+                break
+        
+        return accent
+
+    def _parse_overall_section(self, overall_section):
+        """Parse the overall section into score and summary"""
+        overall = {"score": self._parse_score(overall_section), "summary": ""}
+        
+        # Try to extract summary with multiple approaches
+        # 1. Look for explicit "summary:" label
+        summary_match = re.search(r'(?:summary|overview)[:\s]+(.+)', overall_section, re.IGNORECASE | re.DOTALL)
+        if summary_match:
+            overall["summary"] = summary_match.group(1).strip()
+        else:
+            # 2. Remove the header and use the rest as summary 
+            lines = overall_section.strip().split('\n')
+            if len(lines) > 1:
+                overall["summary"] = '\n'.join(lines[1:]).strip()
+            elif len(overall_section) > 30:
+                # 3. At minimum, take a larger portion of text
+                # Remove the "Overall" header if present
+                cleaned_text = re.sub(r'^Overall[^:]*:?\s*', '', overall_section, flags=re.IGNORECASE)
+                # Remove any score text
+                cleaned_text = re.sub(r'\d+(?:\.\d+)?/10', '', cleaned_text).strip()
+                overall["summary"] = cleaned_text
+        
+        return overall
+
+    def _parse_transcript_section(self, transcript_section):
+        """Parse the transcript section into the spoken text, without heading or quotes"""
+        text = re.sub(r'^[\s#*]*Transcript[\s*:]*', '', transcript_section, flags=re.IGNORECASE)
+        return {"text": text.strip().strip('*"“”').strip()}
+
+    def add_reading_accuracy(self, feedback, text_passage, char_timings=None):
+        """
+        Add a local word-level comparison of the transcript against the passage
+
+        Args:
+            feedback (dict): Output of parse_detailed_feedback
+            text_passage (str): The passage that was read
+            char_timings (list, optional): Character timings for the passage from the
+                speech service, used to timestamp each word. Defaults to None.
+
+        Returns:
+            dict: A copy of feedback with "reading_accuracy" added when a transcript was
+                returned. Feedback may be shared between coalesced requests, so it is not
+                changed in place.
+        """
+        transcript = (feedback.get("transcript") or {}).get("text")
+        if not transcript:
+            return feedback
+        try:
+            reading_accuracy = compare_transcript(text_passage, transcript, char_timings)
+        except Exception as e:
+            # The provider call is already paid for; return its feedback without the report
+            print(f"Error comparing transcript with passage: {e}")
+            return feedback
+        return {**feedback, "reading_accuracy": reading_accuracy}
+
+    def parse_feedback_section(self, key, section_text):
+        """Parse a single section of feedback text identified by its FEEDBACK_SECTIONS key"""
+        if key == "transcript":
+            return self._parse_transcript_section(section_text)
+        if key == "accent":
+            return self._parse_accent_section(section_text)
+        if key == "overall":
+            return self._parse_overall_section(section_text)
+        return self._parse_scored_section(section_text)
+
     def parse_detailed_feedback(self, feedback_text):
         """Parse the detailed feedback text into a structured format"""
         
@@ -271,188 +612,22 @@ Please provide concrete examples and specific suggestions for improvement."""
             "vocabulary": {"score": None, "details": "", "tips": ""},
             "voice_quality": {"score": None, "details": "", "tips": ""},
             "accent": {"identification": "", "intensity": ""},
-            "overall": {"score": None, "summary": ""}
+            "overall": {"score": None, "summary": ""},
+            "transcript": {"text": ""}
         }
         
         try:
-            # Extract pronunciation score
-            pronunciation_match = feedback_text.find("Pronunciation") 
-            if pronunciation_match != -1:
-                # Look for score
-                pron_section = feedback_text[pronunciation_match:feedback_text.find("\n\n", pronunciation_match) if feedback_text.find("\n\n", pronunciation_match) != -1 else len(feedback_text)]
-                
-                # First try decimal format
-                pron_score_match = re.search(r'(\d+\.\d+)(?:/10)', pron_section)
-                
-                if not pron_score_match:
-                    # Then try integer format
-                    pron_score_match = re.search(r'(\d+)(?:/10)', pron_section)
-                    
-                    if pron_score_match:
-                        score_value = int(pron_score_match.group(1))
-                        # Handle incorrectly formatted scores
-                        if score_value > 10:
-                            score_value = score_value / 10
-                        parsed_feedback["pronunciation"]["score"] = round(score_value, 1)
-                else:
-                    # Handle decimal scores directly
-                    parsed_feedback["pronunciation"]["score"] = float(pron_score_match.group(1))
-                
-                # Extract details and tips
-                parsed_feedback["pronunciation"]["details"] = self._extract_content(pron_section, ["details", "examples", "issues"])
-                parsed_feedback["pronunciation"]["tips"] = self._extract_content(pron_section, ["tips", "exercises", "improve", "practice"])
-            
-            # Extract fluency score
-            fluency_match = feedback_text.find("Fluency")
-            if fluency_match != -1:
-                fluency_section = feedback_text[fluency_match:feedback_text.find("\n\n", fluency_match) if feedback_text.find("\n\n", fluency_match) != -1 else len(feedback_text)]
-                
-                # First try decimal format
-                fluency_score_match = re.search(r'(\d+\.\d+)(?:/10)', fluency_section)
-                
-                if not fluency_score_match:
-                    # Then try integer format
-                    fluency_score_match = re.search(r'(\d+)(?:/10)', fluency_section)
-                    
-                    if fluency_score_match:
-                        score_value = int(fluency_score_match.group(1))
-                        # Handle incorrectly formatted scores
-                        if score_value > 10:
-                            score_value = score_value / 10
-                        parsed_feedback["fluency"]["score"] = round(score_value, 1)
-                else:
-                    # Handle decimal scores directly
-                    parsed_feedback["fluency"]["score"] = float(fluency_score_match.group(1))
-                
-                parsed_feedback["fluency"]["details"] = self._extract_content(fluency_section, ["details", "examples", "issues"])
-                parsed_feedback["fluency"]["tips"] = self._extract_content(fluency_section, ["tips", "exercises", "improve", "practice"])
-            
-            # Extract grammar score
-            grammar_match = feedback_text.find("Grammar") 
-            if grammar_match != -1:
-                grammar_section = feedback_text[grammar_match:feedback_text.find("\n\n", grammar_match) if feedback_text.find("\n\n", grammar_match) != -1 else len(feedback_text)]
-                
-                # First try decimal format
-                grammar_score_match = re.search(r'(\d+\.\d+)(?:/10)', grammar_section)
-                
-                if not grammar_score_match:
-                    # Then try integer format
-                    grammar_score_match = re.search(r'(\d+)(?:/10)', grammar_section)
-                    
-                    if grammar_score_match:
-                        score_value = int(grammar_score_match.group(1))
-                        # Handle incorrectly formatted scores
-                        if score_value > 10:
-                            score_value = score_value / 10
-                        parsed_feedback["grammar"]["score"] = round(score_value, 1)
-                else:
-                    # Handle decimal scores directly
-                    parsed_feedback["grammar"]["score"] = float(grammar_score_match.group(1))
-                
-                parsed_feedback["grammar"]["details"] = self._extract_content(grammar_section, ["details", "examples", "issues"])
-                parsed_feedback["grammar"]["tips"] = self._extract_content(grammar_section, ["tips", "exercises", "improve", "practice"])
-            
-            # Extract voice quality score
-            voice_match = feedback_text.find("Voice Quality")
-            if voice_match != -1:
-                voice_section = feedback_text[voice_match:feedback_text.find("\n\n", voice_match) if feedback_text.find("\n\n", voice_match) != -1 else len(feedback_text)]
-                
-                # First try decimal format
-                voice_score_match = re.search(r'(\d+\.\d+)(?:/10)', voice_section)
-                
-                if not voice_score_match:
-                    # Then try integer format
-                    voice_score_match = re.search(r'(\d+)(?:/10)', voice_section)
-                    
-                    if voice_score_match:
-                        score_value = int(voice_score_match.group(1))
-                        # Handle incorrectly formatted scores
-                        if score_value > 10:
-                            score_value = score_value / 10
-                        parsed_feedback["voice_quality"]["score"] = round(score_value, 1)
-                else:
-                    # Handle decimal scores directly
-                    parsed_feedback["voice_quality"]["score"] = float(voice_score_match.group(1))
-                
-                parsed_feedback["voice_quality"]["details"] = self._extract_content(voice_section, ["details", "examples", "issues"])
-                parsed_feedback["voice_quality"]["tips"] = self._extract_content(voice_section, ["tips", "exercises", "improve", "practice"])
-            
-            # Extract accent information
-            accent_match = feedback_text.find("Accent") 
-            if accent_match != -1:
-                accent_section = feedback_text[accent_match:feedback_text.find("\n\n", accent_match) if feedback_text.find("\n\n", accent_match) != -1 else len(feedback_text)]
-                
-                # Try to find accent identification
-                identification_patterns = [
-                    r'(?:sounds like|appears to be|identified as|similar to|characteristic of)\s+([A-Za-z\s]+)(?:accent|speaker)',
-                    r'accent[:\s]+([A-Za-z\s]+)',
-                    r'([A-Za-z\s]+)(?:\s+accent)'
-                ]
-                
-                for pattern in identification_patterns:
-                    accent_id_match = re.search(pattern, accent_section, re.IGNORECASE)
-                    if accent_id_match:
-                        parsed_feedback["accent"]["identification"] = accent_id_match.group(1).strip()
-                        break
-                
-                # Try to find accent intensity
-                intensity_patterns = [
-                    r'(strong|moderate|light|minor|thick|heavy|slight|noticeable)',
-                    r'accent is (strong|moderate|light|minor|thick|heavy|slight|noticeable)'
-                ]
-                
-                for pattern in intensity_patterns:
-                    intensity_match = re.search(pattern, accent_section, re.IGNORECASE)
-                    if intensity_match:
-                        parsed_feedback["accent"]["intensity"] = intensity_match.group(1).strip().capitalize()
-                        break
-            
-            # Extract overall score and summary
-            overall_match = feedback_text.find("Overall") 
-            if overall_match != -1:
-                # Get the overall section - go to the end if no more sections are found
-                next_section = feedback_text.find("\n\n", overall_match)
-                if next_section != -1:
-                    # If there's another section after this, use that as the boundary
-                    overall_section = feedback_text[overall_match:next_section]
-                else:
-                    # If this is the last section, take everything until the end
-                    overall_section = feedback_text[overall_match:]
-                
-                # First, try to match proper score format like "7.5/10"
-                overall_score_match = re.search(r'(\d+\.\d+)(?:/10)', overall_section)
-                
-                if not overall_score_match:
-                    # Then try the standard integer format "7/10"
-                    overall_score_match = re.search(r'(\d+)(?:/10)', overall_section)
-                    
-                    if overall_score_match:
-                        score_value = int(overall_score_match.group(1))
-                        # If the score is greater than 10, it's likely incorrectly formatted (e.g., 75/10 should be 7.5/10)
-                        if score_value > 10:
-                            score_value = score_value / 10
-                        parsed_feedback["overall"]["score"] = round(score_value, 1)
-                else:
-                    # Handle decimal scores directly
-                    parsed_feedback["overall"]["score"] = float(overall_score_match.group(1))
-                
-                # Try to extract summary with multiple approaches
-                # 1. Look for explicit "summary:" label
-                summary_match = re.search(r'(?:summary|overview)[:\s]+(.+)', overall_section, re.IGNORECASE | re.DOTALL)
-                if summary_match:
-                    parsed_feedback["overall"]["summary"] = summary_match.group(1).strip()
-                else:
-                    # 2. Remove the header and use the rest as summary 
-                    lines = overall_section.strip().split('\n')
-                    if len(lines) > 1:
-                        parsed_feedback["overall"]["summary"] = '\n'.join(lines[1:]).strip()
-                    elif len(overall_section) > 30:
-                        # 3. At minimum, take a larger portion of text
-                        # Remove the "Overall" header if present
-                        cleaned_text = re.sub(r'^Overall[^:]*:?\s*', '', overall_section, flags=re.IGNORECASE)
-                        # Remove any score text
-                        cleaned_text = re.sub(r'\d+(?:\.\d+)?/10', '', cleaned_text).strip()
-                        parsed_feedback["overall"]["summary"] = cleaned_text
+            # Each section runs from its heading to the next blank line (or the end)
+            for key, heading in FEEDBACK_SECTIONS:
+                section_start = feedback_text.find(heading)
+                if section_start == -1:
+                    continue
+                section_end = -1
+                if key not in OPEN_ENDED_SECTIONS:
+                    section_end = feedback_text.find("\n\n", section_start)
+                if section_end == -1:
+                    section_end = len(feedback_text)
+                parsed_feedback[key] = self.parse_feedback_section(key, feedback_text[section_start:section_end])
             
             # Calculate overall score if not found
             if parsed_feedback["overall"]["score"] is None:
@@ -506,5 +681,59 @@ Please provide concrete examples and specific suggestions for improvement."""
         return section_text.strip()
 
 
+class IncrementalFeedbackParser:
+    """
+    Parses feedback text as it streams in, emitting each section once it is complete.
+    
+    Sections use the same boundaries as parse_detailed_feedback: a section starts at the
+    first occurrence of its heading and is complete at the next blank line. Sections in
+    OPEN_ENDED_SECTIONS are only complete when the stream ends.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.text = ""
+        self._heading_positions = {}
+        self._emitted = set()
+
+    def feed(self, delta):
+        """Append streamed text and return (key, section) pairs that just completed"""
+        previous_length = len(self.text)
+        self.text += delta
+        completed = []
+        
+        for key, heading in FEEDBACK_SECTIONS:
+            if key in self._emitted:
+                continue
+            
+            # Only rescan the tail that could contain a newly arrived heading
+            start = self._heading_positions.get(key)
+            if start is None:
+                start = self.text.find(heading, max(0, previous_length - len(heading) + 1))
+                if start == -1:
+                    continue
+                self._heading_positions[key] = start
+            if key in OPEN_ENDED_SECTIONS:
+                continue
+            
+            end = self.text.find("\n\n", max(start, previous_length - 1))
+            if end != -1:
+                self._emitted.add(key)
+                completed.append((key, self.service.parse_feedback_section(key, self.text[start:end])))
+        
+        return completed
+
+    def finish(self):
+        """Return (key, section) pairs for sections still open when the stream ended"""
+        completed = []
+        for key, heading in FEEDBACK_SECTIONS:
+            start = self._heading_positions.get(key)
+            if key in self._emitted or start is None:
+                continue
+            self._emitted.add(key)
+            completed.append((key, self.service.parse_feedback_section(key, self.text[start:])))
+        return completed
+
+
 # Singleton instance
 openai_service = OpenAIService()
\ No newline at end of file
@@ -0,0 +1,155 @@
+"""
+Shared State Module
+Cross-process key/value store backed by SQLite, so several gunicorn workers on
+one node share caches, upload sessions and audio file metadata.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Default location of the state database, relative to the project root
+DEFAULT_STATE_DB_PATH = os.path.join(os.path.dirname(__file__), 'instance', 'shared_state.db')
+
+
+class SQLiteStateStore:
+    """
+    Namespaced key/value store with optional expiry.
+
+    Each thread gets its own connection; SQLite's WAL mode lets readers in other
+    worker processes proceed while one writer holds the lock.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv("STATE_DB_PATH") or DEFAULT_STATE_DB_PATH
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS kv (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB,
+                    expires_at REAL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (namespace, expires_at)")
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key, default=None):
+        """Return the raw value stored under key, or default if missing or expired"""
+        row = self._connect().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return row[0] if row else default
+
+    def set(self, namespace, key, value, ttl=None):
+        """Store a raw (bytes or str) value, optionally expiring after ttl seconds"""
+        expires_at = time.time() + ttl if ttl else None
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, value, expires_at)
+        )
+
+    def get_json(self, namespace, key, default=None):
+        """Return a JSON value stored with set_json"""
+        value = self.get(namespace, key)
+        return json.loads(value) if value is not None else default
+
+    def set_json(self, namespace, key, value, ttl=None):
+        """Store a JSON-serializable value"""
+        self.set(namespace, key, json.dumps(value), ttl=ttl)
+
+    def delete(self, namespace, key):
+        """Remove a key"""
+        self._connect().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def incr(self, namespace, key, amount=1):
+        """Atomically add amount to an integer counter and return the new value"""
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO kv (namespace, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value",
+            (namespace, key, amount)
+        )
+        return int(self.get(namespace, key, 0))
+
+    def incr_many(self, namespace, amounts):
+        """Add several amounts to integer counters in one transaction"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO kv (namespace, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value",
+                [(namespace, key, amount) for key, amount in amounts.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def items(self, namespace):
+        """Return all unexpired (key, raw value) pairs in a namespace"""
+        return self._connect().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time())
+        ).fetchall()
+
+    def delete_expired(self, namespace):
+        """
+        Remove expired entries in a namespace whose values need no cleanup
+
+        Returns:
+            int: Number of entries removed
+        """
+        cursor = self._connect().execute(
+            "DELETE FROM kv WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+            (namespace, time.time())
+        )
+        return cursor.rowcount
+
+    def pop_expired(self, namespace):
+        """
+        Atomically remove and return expired entries in a namespace
+
+        Only one process receives each expired entry, so callers can safely
+        clean up resources (such as files) that the entry describes.
+
+        Returns:
+            list: (key, raw value) pairs that were removed
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT key, value FROM kv WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, now)
+            ).fetchall()
+            conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
@@ -0,0 +1,91 @@
+"""
+Single-Flight Module
+Coalesces identical concurrent provider requests: the first caller for a key makes
+the call and every caller that arrives while it is in flight waits for and shares
+its result.
+"""
+
+import threading
+import time
+
+from deadline import DeadlineExceeded
+from metrics import metrics
+
+
+class _Call:
+    """An in-flight call and its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Per-process request coalescing keyed on normalized request parameters.
+
+    Counters "singleflight.<name>.leaders" (calls made) and
+    "singleflight.<name>.followers" (calls avoided) are recorded in metrics. Each
+    caller is counted once, in the role it finished in.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn() unless an identical call is already in flight
+
+        Args:
+            key: Hashable key identifying identical requests
+            fn (callable): Makes the provider call
+            timeout (float, optional): This caller's remaining time budget. A waiting
+                caller raises DeadlineExceeded once it runs out. Defaults to None (no limit).
+
+        Returns:
+            tuple: (result, shared) where shared is True if the result came from
+                another caller's in-flight call. Exceptions from fn are raised to
+                every waiting caller, except DeadlineExceeded: the leader's deadline
+                is its own, so waiting callers with time left retry instead.
+        """
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._calls[key] = call
+
+            if leader:
+                break
+
+            if expires_at is not None:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0 or not call.done.wait(remaining):
+                    metrics.incr(f"singleflight.{self.name}.followers")
+                    raise DeadlineExceeded("Request deadline exceeded waiting for an identical in-flight request")
+            else:
+                call.done.wait()
+            if isinstance(call.error, DeadlineExceeded):
+                # Run the call again (or join whoever already is) with this caller's deadline
+                continue
+            metrics.incr(f"singleflight.{self.name}.followers")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        metrics.incr(f"singleflight.{self.name}.leaders")
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -12,6 +12,13 @@ const AudioRecorder = {
   audioChunks: [],
   completionCallback: null,
 
+  // Chunked upload state: chunks are sent to the server while recording
+  chunkIntervalMs: 1000,
+  uploadSessionPromise: null,
+  uploadQueue: null,
+  uploadFailed: false,
+  uploadSeq: 0,
+
   // Initialize the audio recorder
   initialize: function () {
     console.log("AudioRecorder initialized");
@@ -22,6 +29,64 @@ const AudioRecorder = {
     return this.isRecording;
   },
 
+  // Open a server-side upload session so transcoding starts before recording stops
+  startUploadSession: function () {
+    this.uploadFailed = false;
+    this.uploadSeq = 0;
+    this.uploadSessionPromise = fetch("/upload-sessions", { method: "POST" })
+      .then((response) => response.json())
+      .then((data) => {
+        if (!data.success) throw new Error(data.error);
+        console.log("Upload session started:", data.session_id);
+        return data.session_id;
+      })
+      .catch((error) => {
+        console.warn("Chunked upload unavailable, will send full recording:", error);
+        this.uploadFailed = true;
+        return null;
+      });
+    this.uploadQueue = this.uploadSessionPromise;
+  },
+
+  // Queue a chunk for upload; chunks are sent one at a time to keep them in order
+  uploadChunk: function (chunk) {
+    const seq = this.uploadSeq++;
+    const sessionPromise = this.uploadSessionPromise;
+    this.uploadQueue = this.uploadQueue.then(() =>
+      sessionPromise.then((sessionId) => {
+        if (!sessionId || this.uploadFailed) return;
+        return fetch(`/upload-sessions/${sessionId}/chunks?seq=${seq}`, {
+          method: "POST",
+          headers: { "Content-Type": "application/octet-stream" },
+          body: chunk,
+        })
+          .then((response) => response.json())
+          .then((data) => {
+            if (!data.success) throw new Error(data.error);
+          })
+          .catch((error) => {
+            console.warn("Chunk upload failed, will send full recording:", error);
+            this.uploadFailed = true;
+          });
+      })
+    );
+  },
+
+  // Resolves with the upload session ID once every chunk is uploaded, or null
+  // if chunked upload failed and the full recording should be sent instead
+  finishUploads: function () {
+    const sessionPromise = this.uploadSessionPromise;
+    return this.uploadQueue
+      .then(() => sessionPromise)
+      .then((sessionId) => {
+        if (sessionId && this.uploadFailed) {
+          fetch(`/upload-sessions/${sessionId}`, { method: "DELETE" });
+          return null;
+        }
+        return sessionId;
+      });
+  },
+
   // Start recording
   startRecording: function (callback) {
     if (this.isRecording) {
@@ -31,6 +96,7 @@ const AudioRecorder = {
 
     this.completionCallback = callback;
     this.audioChunks = [];
+    this.startUploadSession();
 
     console.log("Requesting microphone access");
 
@@ -58,6 +124,7 @@ const AudioRecorder = {
         this.mediaRecorder.addEventListener("dataavailable", (event) => {
           if (event.data.size > 0) {
             this.audioChunks.push(event.data);
+            this.uploadChunk(event.data);
           }
         });
 
@@ -70,12 +137,13 @@ const AudioRecorder = {
             type: "audio/webm;codecs=opus",
           });
           const reader = new FileReader();
+          const uploadSession = this.finishUploads();
 
           reader.onloadend = () => {
             const base64data = reader.result;
 
             if (this.completionCallback) {
-              this.completionCallback(base64data);
+              this.completionCallback(base64data, uploadSession);
             }
           };
 
@@ -85,8 +153,8 @@ const AudioRecorder = {
           stream.getTracks().forEach((track) => track.stop());
         });
 
-        // Start recording
-        this.mediaRecorder.start();
+        // Start recording, emitting a chunk every interval for incremental upload
+        this.mediaRecorder.start(this.chunkIntervalMs);
         this.isRecording = true;
         console.log("Recording started with format:", options.mimeType);
 
@@ -794,7 +794,7 @@ function initApp() {
             // Start recording with a callback for when recording completes
             console.log("Starting audio recording...");
             // Make sure recording continues until explicitly stopped
-            AudioRecorder.startRecording(function (recordingData) {
+            AudioRecorder.startRecording(function (recordingData, uploadSession) {
               // This callback is only called when the user explicitly stops the recording
               console.log(
                 "Recording complete (user stopped it), size:",
@@ -899,20 +899,30 @@ function initApp() {
                   `Language preferences - Native: ${nativeLanguage}, Target: ${targetLanguage}, Accent Goal: ${accentGoal}`
                 );
 
-                fetch("/analyze-speech", {
-                  method: "POST",
-                  headers: {
-                    "Content-Type": "application/json",
-                  },
-                  body: JSON.stringify({
-                    audio: recordingData,
-                    passage: text,
-                    native_language: nativeLanguage,
-                    target_language: targetLanguage,
-                    accent_goal: accentGoal,
-                  }),
-                })
-                  .then((response) => response.json())
+                const analysisPayload = {
+                  learner_id: getLearnerId(),
+                  passage: text,
+                  native_language: nativeLanguage,
+                  target_language: targetLanguage,
+                  accent_goal: accentGoal,
+                  char_timings: data.char_timings,
+                };
+
+                // Prefer the upload session (already transcoded while recording);
+                // fall back to posting the full recording
+                Promise.resolve(uploadSession)
+                  .then((sessionId) =>
+                    sessionId
+                      ? streamSpeechAnalysis(
+                          analysisPayload,
+                          `/upload-sessions/${sessionId}/analyze`
+                        )
+                      : streamSpeechAnalysis({
+                          ...analysisPayload,
+                          audio: recordingData,
+                        })
+                  )
+                  // Stream the analysis so each feedback section shows up as soon as it is ready
                   .then((data) => {
                     console.log("Analysis response received:", data.success);
 
@@ -1132,6 +1142,19 @@ function initApp() {
 
                           feedbackItem.innerHTML = content;
 
+                          // Mark misread and skipped words in the passage
+                          if (
+                            data.feedback.reading_accuracy &&
+                            window.TextHighlighter
+                          ) {
+                            feedbackItem.appendChild(
+                              window.TextHighlighter.renderWordErrors(
+                                text,
+                                data.feedback.reading_accuracy
+                              )
+                            );
+                          }
+
                           // Add to history
                           const feedbackHistory =
                             document.getElementById("feedback-history");
@@ -1698,6 +1721,132 @@ function initApp() {
     return false;
   }
 
+  // Anonymous learner ID kept in this browser so sessions build up a history
+  function getLearnerId() {
+    try {
+      let learnerId = localStorage.getItem("learnerId");
+      if (!learnerId) {
+        learnerId =
+          window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : Date.now().toString(36) + Math.random().toString(36).slice(2);
+        localStorage.setItem("learnerId", learnerId);
+      }
+      return learnerId;
+    } catch (error) {
+      console.warn("Could not access localStorage for learner ID:", error);
+      return null;
+    }
+  }
+
+  // Post a recording for streamed analysis and render sections as they arrive.
+  // Resolves with the same { success, feedback } shape as /analyze-speech.
+  async function streamSpeechAnalysis(payload, url = "/analyze-speech-stream") {
+    const response = await fetch(url, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify(payload),
+    });
+
+    // Validation errors come back as plain JSON rather than an event stream
+    const contentType = response.headers.get("Content-Type") || "";
+    if (!contentType.includes("text/event-stream")) {
+      return response.json();
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let result = null;
+
+    while (result === null) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Events are separated by a blank line
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let eventName = "message";
+        let eventData = "";
+        rawEvent.split("\n").forEach((line) => {
+          if (line.startsWith("event: ")) eventName = line.slice(7);
+          else if (line.startsWith("data: ")) eventData += line.slice(6);
+        });
+        const data = eventData ? JSON.parse(eventData) : {};
+
+        if (eventName === "section") {
+          renderStreamedSection(data.section, data.data);
+        } else if (eventName === "retry") {
+          showLoadingIndicator("Refining your feedback...");
+        } else if (eventName === "complete" || eventName === "error") {
+          result = data;
+        }
+      }
+    }
+
+    return (
+      result || { success: false, error: "Analysis stream ended unexpectedly" }
+    );
+  }
+
+  // Show a single streamed feedback section in the main feedback area
+  function renderStreamedSection(key, section) {
+    const feedbackText = document.getElementById("feedback-text");
+    if (!feedbackText || !section) return;
+
+    // Replace the spinner with a section list on the first section
+    let sectionList = feedbackText.querySelector(".streamed-feedback");
+    if (!sectionList) {
+      feedbackText.innerHTML = '<div class="streamed-feedback"></div>';
+      sectionList = feedbackText.querySelector(".streamed-feedback");
+    }
+
+    const title = key
+      .split("_")
+      .map((word) => word.charAt(0).toUpperCase() + word.slice(1))
+      .join(" ");
+
+    let body;
+    if (key === "accent") {
+      body = `<p><strong>Identification:</strong> ${
+        section.identification || "Not identified"
+      }</p>
+        <p><strong>Intensity:</strong> ${
+          section.intensity || "Not specified"
+        }</p>`;
+    } else if (key === "transcript") {
+      body = `<p><em>${formatFeedbackText(
+        section.text || "No transcript provided."
+      )}</em></p>`;
+    } else {
+      body = `<p>${formatFeedbackText(
+        section.details || section.summary || "No details provided."
+      )}</p>`;
+    }
+
+    let sectionEl = sectionList.querySelector(`[data-section="${key}"]`);
+    if (!sectionEl) {
+      sectionEl = document.createElement("div");
+      sectionEl.className = "feedback-section";
+      sectionEl.dataset.section = key;
+      sectionList.appendChild(sectionEl);
+    }
+    sectionEl.innerHTML = `
+      <h4>${title}${
+        section.score !== undefined && section.score !== null
+          ? `: ${section.score}/10`
+          : ""
+      }</h4>
+      ${body}
+    `;
+  }
+
   // Helper function to format feedback text with line breaks
   function formatFeedbackText(text) {
     if (!text || typeof text !== "string") return "No data available";
@@ -321,6 +321,57 @@ class TextHighlighter {
     const chars = this.passageElement.querySelectorAll(".char");
     chars.forEach((char) => char.classList.remove(this.highlightClassName));
   }
+
+  /**
+   * Render the passage with misread and skipped words marked
+   * @param {string} text - The passage that was read
+   * @param {Object} readingAccuracy - The reading_accuracy report from the analysis
+   * @returns {HTMLElement} A feedback section containing the marked passage
+   */
+  renderWordErrors(text, readingAccuracy) {
+    const section = document.createElement("div");
+    section.className = "feedback-section reading-accuracy";
+
+    const summary = readingAccuracy.summary || {};
+    const heading = document.createElement("h4");
+    heading.textContent =
+      summary.accuracy !== null && summary.accuracy !== undefined
+        ? `Reading Accuracy: ${Math.round(summary.accuracy * 100)}%`
+        : "Reading Accuracy";
+    section.appendChild(heading);
+
+    const passage = document.createElement("p");
+    passage.className = "marked-passage";
+    const spans = text.split("").map((char) => {
+      const span = document.createElement("span");
+      span.textContent = char;
+      span.classList.add("char");
+      passage.appendChild(span);
+      return span;
+    });
+
+    (readingAccuracy.words || []).forEach((word) => {
+      if (word.status === "correct") {
+        return;
+      }
+      const className = word.status === "omitted" ? "omitted" : "misread";
+      const title =
+        word.status === "omitted" ? "Skipped" : `You said "${word.spoken}"`;
+      spans.slice(word.char_start, word.char_end).forEach((span) => {
+        span.classList.add(className);
+        span.title = title;
+      });
+    });
+    section.appendChild(passage);
+
+    const counts = document.createElement("p");
+    counts.textContent = `${summary.substitutions || 0} misread, ${
+      summary.omissions || 0
+    } skipped, ${summary.insertions || 0} added`;
+    section.appendChild(counts);
+
+    return section;
+  }
 }
 
 // Create and export the TextHighlighter instance
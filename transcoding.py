@@ -0,0 +1,53 @@
+"""
+Transcoding Module
+Converts recordings to MP3 with ffmpeg before they are sent for analysis. Kept
+apart from the provider services so callers that only transcode, such as batch
+grading's worker processes, don't need an API client.
+"""
+
+import os
+import subprocess
+import tempfile
+
+from deadline import DeadlineExceeded
+
+
+def convert_to_mp3(audio_file_path, deadline=None):
+    """
+    Convert an audio file to MP3 using ffmpeg
+
+    If a deadline is given, ffmpeg is killed when it runs out.
+
+    Returns:
+        bytes: The converted MP3 data
+    """
+    # Ensure the audio file exists
+    if not os.path.exists(audio_file_path):
+        raise FileNotFoundError(f"Audio file not found: {audio_file_path}")
+
+    # Use a unique output file so concurrent conversions don't collide
+    with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
+        output_mp3 = temp_file.name
+
+    try:
+        if deadline is not None:
+            deadline.check("transcoding")
+        try:
+            subprocess.run([
+                "ffmpeg", 
+                "-y",
+                "-i", audio_file_path, 
+                "-codec:a", "libmp3lame", 
+                "-qscale:a", "2", 
+                output_mp3
+            ], check=True, timeout=deadline.remaining() if deadline is not None else None)
+        except subprocess.TimeoutExpired:
+            raise DeadlineExceeded("Request deadline exceeded during transcoding")
+
+        # Read the converted MP3 file
+        with open(output_mp3, "rb") as f:
+            return f.read()
+    finally:
+        # Clean up temporary file
+        if os.path.exists(output_mp3):
+            os.remove(output_mp3)
@@ -0,0 +1,254 @@
+"""
+Upload Session Module
+Accepts recording chunks while the user is still speaking and transcodes them
+to MP3 incrementally, so the audio is ready for analysis as soon as recording stops.
+
+Session metadata lives in the shared state store and chunks are appended to a
+file under a per-session lock, so any worker process can accept any chunk. The
+incremental ffmpeg process belongs to the worker that created the session; if a
+chunk lands on another worker the session falls back to a one-shot conversion
+when it finishes.
+"""
+
+import fcntl
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+from deadline import DeadlineExceeded
+
+# Session limits
+SESSION_TTL_SECONDS = 300  # Idle sessions are discarded after 5 minutes
+MAX_SESSION_BYTES = 25 * 1024 * 1024  # Upper bound on a single recording
+FINISH_TIMEOUT_SECONDS = 30  # How long to wait for ffmpeg to flush after the last chunk
+MAX_ACTIVE_SESSIONS = int(os.getenv("MAX_UPLOAD_SESSIONS", "16"))  # Incremental transcoders per worker process
+
+STATE_NAMESPACE = "upload_sessions"
+
+
+class UploadSessionError(Exception):
+    """Raised when a chunk or finish request cannot be applied to a session"""
+
+
+class UploadSessionLimitError(UploadSessionError):
+    """Raised when this worker already has MAX_ACTIVE_SESSIONS open sessions"""
+
+
+class UploadSessionManager:
+    """Tracks in-progress upload sessions across worker processes"""
+
+    def __init__(self, state_store, upload_dir=None):
+        self.state_store = state_store
+        self.upload_dir = upload_dir or os.path.join(tempfile.gettempdir(), "language_help_uploads")
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+        # Incremental transcoders owned by this process, keyed on session ID
+        self._transcoders = {}
+        self._lock = threading.Lock()
+
+    def create(self):
+        """
+        Start a new upload session and return its ID
+
+        Each session holds an ffmpeg process open until it finishes, so once this
+        worker has MAX_ACTIVE_SESSIONS open, UploadSessionLimitError is raised and
+        the client should post the full recording instead.
+        """
+        self.purge_expired()
+        with self._lock:
+            active_sessions = len(self._transcoders)
+        if active_sessions >= MAX_ACTIVE_SESSIONS:
+            raise UploadSessionLimitError("Too many active upload sessions; send the full recording instead")
+
+        session_id = uuid.uuid4().hex
+        directory = os.path.join(self.upload_dir, session_id)
+        os.makedirs(directory)
+        open(os.path.join(directory, "recording.webm"), "wb").close()
+
+        # ffmpeg reads the container stream from stdin and writes MP3 as data arrives
+        transcoder = subprocess.Popen([
+            "ffmpeg",
+            "-y",
+            "-loglevel", "error",
+            "-i", "pipe:0",
+            "-codec:a", "libmp3lame",
+            "-qscale:a", "2",
+            "-f", "mp3",
+            os.path.join(directory, "recording.mp3")
+        ], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        # Save before registering the transcoder, so reaping never sees it without a session
+        self._save(session_id, {
+            "directory": directory,
+            "next_seq": 0,
+            "received_bytes": 0,
+            "incremental": True,
+            "finished": False
+        })
+        with self._lock:
+            self._transcoders[session_id] = transcoder
+        print(f"Started upload session {session_id} in process {os.getpid()}")
+        return session_id
+
+    def append(self, session_id, seq, data):
+        """Append the chunk with sequence number `seq`, returning the total bytes received"""
+        with self._locked(session_id) as session:
+            if session["finished"]:
+                raise UploadSessionError("Upload session is already finished")
+            if seq != session["next_seq"]:
+                raise UploadSessionError(f"Expected chunk {session['next_seq']}, got {seq}")
+            if session["received_bytes"] + len(data) > MAX_SESSION_BYTES:
+                raise UploadSessionError("Recording exceeds the maximum upload size")
+
+            # Keep the raw stream so we can fall back to a one-shot conversion
+            with open(os.path.join(session["directory"], "recording.webm"), "ab") as f:
+                f.write(data)
+
+            if session["incremental"]:
+                transcoder = self._transcoders.get(session_id)
+                if transcoder is None:
+                    # The transcoder lives in another worker and has missed this chunk
+                    session["incremental"] = False
+                else:
+                    try:
+                        transcoder.stdin.write(data)
+                        transcoder.stdin.flush()
+                    except (BrokenPipeError, OSError) as e:
+                        print(f"Incremental transcoder for session {session_id} stopped: {e}")
+                        session["incremental"] = False
+                        self._stop_transcoder(session_id)
+
+            session["next_seq"] += 1
+            session["received_bytes"] += len(data)
+            self._save(session_id, session)
+            return session["received_bytes"]
+
+    def finish(self, session_id, deadline=None):
+        """
+        Close the stream and return the transcoded recording; the session is removed either way
+
+        If a deadline is given, waiting on ffmpeg is bounded by it and
+        DeadlineExceeded is raised when it runs out.
+
+        Returns:
+            bytes: The recording as MP3
+        """
+        try:
+            with self._locked(session_id) as session:
+                if session["finished"]:
+                    raise UploadSessionError("Upload session is already finished")
+                if session["received_bytes"] == 0:
+                    raise UploadSessionError("No audio chunks were uploaded")
+                session["finished"] = True
+                self._save(session_id, session)
+
+                raw_path = os.path.join(session["directory"], "recording.webm")
+                mp3_path = os.path.join(session["directory"], "recording.mp3")
+
+                transcoder = self._transcoders.get(session_id)
+                incremental_ok = False
+                if session["incremental"] and transcoder is not None:
+                    try:
+                        transcoder.stdin.close()
+                        wait_timeout = FINISH_TIMEOUT_SECONDS
+                        if deadline is not None:
+                            wait_timeout = min(wait_timeout, deadline.remaining())
+                        transcoder.wait(timeout=wait_timeout)
+                        incremental_ok = transcoder.returncode == 0
+                    except (subprocess.TimeoutExpired, BrokenPipeError, OSError) as e:
+                        print(f"Incremental transcoder for session {session_id} failed to finish: {e}")
+                self._stop_transcoder(session_id)
+
+                if not incremental_ok:
+                    # Convert the buffered stream in one go
+                    if deadline is not None:
+                        deadline.check("transcoding")
+                    print(f"Falling back to full conversion for session {session_id}")
+                    try:
+                        subprocess.run([
+                            "ffmpeg",
+                            "-y",
+                            "-i", raw_path,
+                            "-codec:a", "libmp3lame",
+                            "-qscale:a", "2",
+                            mp3_path
+                        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            timeout=deadline.remaining() if deadline is not None else None)
+                    except subprocess.TimeoutExpired:
+                        raise DeadlineExceeded("Request deadline exceeded during transcoding")
+
+                with open(mp3_path, "rb") as f:
+                    return f.read()
+        finally:
+            self.discard(session_id)
+
+    def discard(self, session_id):
+        """Remove a session and its files"""
+        self._stop_transcoder(session_id)
+        session = self.state_store.get_json(STATE_NAMESPACE, session_id)
+        self.state_store.delete(STATE_NAMESPACE, session_id)
+        if session is not None:
+            shutil.rmtree(session["directory"], ignore_errors=True)
+
+    def purge_expired(self):
+        """Discard sessions that have been idle longer than SESSION_TTL_SECONDS"""
+        for session_id, value in self.state_store.pop_expired(STATE_NAMESPACE):
+            print(f"Discarding idle upload session {session_id}")
+            self._stop_transcoder(session_id)
+            shutil.rmtree(os.path.join(self.upload_dir, session_id), ignore_errors=True)
+        self._reap_transcoders()
+
+    def _reap_transcoders(self):
+        """
+        Stop this process's transcoders for sessions that no longer need them
+
+        A session finished, discarded or expired on another worker leaves its
+        transcoder here blocked on an open stdin, as does one that fell back to
+        a one-shot conversion.
+        """
+        with self._lock:
+            session_ids = list(self._transcoders)
+        for session_id in session_ids:
+            session = self.state_store.get_json(STATE_NAMESPACE, session_id)
+            if session is None or not session["incremental"]:
+                print(f"Stopping orphaned transcoder for upload session {session_id}")
+                self._stop_transcoder(session_id)
+
+    def _save(self, session_id, session):
+        """Persist session metadata, refreshing its idle timeout"""
+        self.state_store.set_json(STATE_NAMESPACE, session_id, session, ttl=SESSION_TTL_SECONDS)
+
+    @contextmanager
+    def _locked(self, session_id):
+        """Hold the session's cross-process lock and yield its metadata"""
+        session = self.state_store.get_json(STATE_NAMESPACE, session_id)
+        if session is None:
+            raise UploadSessionError(f"Unknown upload session: {session_id}")
+
+        lock_path = os.path.join(session["directory"], ".lock")
+        try:
+            lock_file = open(lock_path, "a")
+        except FileNotFoundError:
+            raise UploadSessionError(f"Unknown upload session: {session_id}")
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Re-read under the lock in case another worker updated the session
+            session = self.state_store.get_json(STATE_NAMESPACE, session_id)
+            if session is None:
+                raise UploadSessionError(f"Unknown upload session: {session_id}")
+            yield session
+
+    def _stop_transcoder(self, session_id):
+        """Kill this process's incremental transcoder for a session, if any"""
+        with self._lock:
+            transcoder = self._transcoders.pop(session_id, None)
+        if transcoder is not None and transcoder.poll() is None:
+            try:
+                transcoder.kill()
+                transcoder.wait()
+            except OSError:
+                pass
@@ -0,0 +1,132 @@
+"""
+Warm-up Module
+Pays the first-request costs up front: TLS handshakes to both providers, a cold
+ffmpeg binary and the feedback parser's regular expressions. Readiness is
+reported through /ready so the load balancer only routes traffic to warm workers.
+
+Both provider clients keep idle connections for PROVIDER_KEEPALIVE_SECONDS (300 s
+by default). A worker left idle longer than that, or whose connections the
+provider closes first, reconnects on its next request despite reporting ready.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import traceback
+import wave
+
+from openai_service import IncrementalFeedbackParser
+from transcoding import convert_to_mp3
+
+# Feedback text covering every section the parser looks for
+SAMPLE_FEEDBACK = """Pronunciation: 7/10
+Details: Clear vowels. Tips: Practice the 'th' sound.
+
+Fluency and Coherence: 7.5/10
+Examples: Steady pace with few pauses.
+
+Grammar: 8/10
+Details: Accurate reading.
+
+Voice Quality: 8/10
+Details: Good projection.
+
+Accent Analysis: sounds like a Spanish accent, light intensity.
+
+Overall: 7.5/10
+Summary: Good reading overall.
+
+Transcript: The rain fell softly on the roof."""
+
+
+class Warmup:
+    """Runs warm-up steps once and tracks whether this worker is ready"""
+
+    def __init__(self, openai_service, elevenlabs_service):
+        self.openai_service = openai_service
+        self.elevenlabs_service = elevenlabs_service
+        self.status = "cold"
+        self.steps = {}
+        self._lock = threading.Lock()
+
+    def is_ready(self):
+        """Check whether warm-up has finished"""
+        return self.status == "ready"
+
+    def mark_ready(self):
+        """Report ready without warming (warm-up disabled)"""
+        self.status = "ready"
+
+    def start(self):
+        """Run warm-up on a background thread; /ready reports not ready until it finishes"""
+        thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        """Run all warm-up steps. Failed steps are recorded but don't block readiness."""
+        with self._lock:
+            if self.status != "cold":
+                return
+            self.status = "warming"
+
+        print("Starting warm-up")
+        started = time.time()
+        for name, step in [
+            ("openai_connection", self._warm_openai),
+            ("elevenlabs_connection", self._warm_elevenlabs),
+            ("transcoder", self._warm_transcoder),
+            ("feedback_parser", self._warm_parser),
+        ]:
+            self._run_step(name, step)
+
+        self.status = "ready"
+        print(f"Warm-up finished in {time.time() - started:.2f}s")
+
+    def state(self):
+        """Return warm-up status and per-step results"""
+        return {
+            "status": self.status,
+            "steps": dict(self.steps)
+        }
+
+    def _run_step(self, name, step):
+        started = time.time()
+        try:
+            step()
+            self.steps[name] = {"ok": True, "seconds": round(time.time() - started, 3)}
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e}")
+            print(f"Traceback: {traceback.format_exc()}")
+            self.steps[name] = {"ok": False, "seconds": round(time.time() - started, 3), "error": str(e)}
+
+    def _warm_openai(self):
+        """Open a pooled TLS connection to OpenAI with a cheap authenticated call"""
+        self.openai_service.client.models.list()
+
+    def _warm_elevenlabs(self):
+        """Open a pooled TLS connection to ElevenLabs with a cheap authenticated call"""
+        self.elevenlabs_service.client.voices.get_all()
+
+    def _warm_transcoder(self):
+        """Run ffmpeg once on a short silent clip so its binary and codecs are paged in"""
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
+            silent_path = temp_file.name
+        try:
+            with wave.open(silent_path, "wb") as clip:
+                clip.setnchannels(1)
+                clip.setsampwidth(2)
+                clip.setframerate(16000)
+                clip.writeframes(b"\x00\x00" * 1600)
+            convert_to_mp3(silent_path)
+        finally:
+            os.unlink(silent_path)
+
+    def _warm_parser(self):
+        """Parse and align sample feedback so the parser's patterns are compiled and cached"""
+        feedback = self.openai_service.parse_detailed_feedback(SAMPLE_FEEDBACK)
+        self.openai_service.add_reading_accuracy(feedback, "The rain fell gently on the roof.")
+        parser = IncrementalFeedbackParser(self.openai_service)
+        parser.feed(SAMPLE_FEEDBACK)
+        parser.finish()